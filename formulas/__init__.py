@@ -94,13 +94,15 @@ describe2(Tuple, Tuple(Ellipsis), "Tuple with given elements", None,
 
 entries_dict = {}
 for entry in all_entries:
-    if entry.id() in entries_dict:
-        raise ValueError("duplicated ID %s" % entry.id())
-    entries_dict[entry.id()] = entry
+    entry_id = entry.id()
+    if entry_id in entries_dict:
+        raise ValueError("duplicated ID %s" % entry_id)
+    entries_dict[entry_id] = entry
 
 topics_dict = {}
 for topic in all_topics:
-    if topic.title() in topics_dict:
-        raise ValueError("duplicated title %s" % topic.title())
-    topics_dict[topic.title()] = topic
+    topic_title = topic.title()
+    if topic_title in topics_dict:
+        raise ValueError("duplicated title %s" % topic_title)
+    topics_dict[topic_title] = topic
 
@@ -1,10 +1,48 @@
 # -*- coding: utf-8 -*-
 
+import sys
+from functools import lru_cache
+from weakref import WeakValueDictionary
+
 int_types = (int, type(1<<128))
 
 katex_function = []
 
-int_cache = {}
+# intern table for atoms, keyed by (tag, value)
+_atom_cache = {}
+
+# intern table for non-atomic expressions, keyed by the (f, a, b, ...) tuple
+_call_cache = WeakValueDictionary()
+
+# escapes for text atoms in source form and in LaTeX
+_str_escape = str.maketrans({'"': '\\"'})
+_latex_text_escape = str.maketrans({'_': '\\_'})
+
+# constant HTML fragments shared by the entry renderers
+_html_mdash = """ <span style="color:#888">&mdash;</span> """
+_html_image_head = ("""<div style="text-align:center; margin:0.6em 0.4em 0.0em 0.2em">"""
+    """<span style="font-size:85%; color:#888">Image:</span> """)
+_html_symbol_head = ("""<div style="text-align:center; margin:0.6em">"""
+    """<span style="font-size:85%; color:#888">Symbol:</span> """)
+_html_downloads_head = ("""<div style="text-align:center; margin-top:0; margin-bottom:1.1em">"""
+    """<span style="font-size:85%; color:#888">Download:</span> """)
+
+# splits the text of a Decimal into (mantissa, exponent or None); shared
+# by the HTML and LaTeX renderers
+@lru_cache(maxsize=1<<12)
+def _decimal_parts(text):
+    if "e" in text:
+        mant, expo = text.split("e")
+        return mant, expo.lstrip("+")
+    return text, None
+
+@lru_cache(maxsize=1<<16)
+def _latex_cached(expr, in_small):
+    return _latex(expr, in_small)
+
+@lru_cache(maxsize=1<<14)
+def _html_cached(expr, display, avoid_latex, single, katex):
+    return expr._html(display, avoid_latex, single, katex)
 
 class Expr(object):
     """
@@ -28,6 +66,11 @@ class Expr(object):
     perform structural comparison.
     """
 
+    # _tag identifies the kind of node and _val holds the payload:
+    # 0 = symbol (name), 1 = integer (int), 2 = text (str),
+    # 3 = call (tuple (a, b, ...) of arguments, with f stored in _head).
+    __slots__ = ('_tag', '_head', '_val', '_hash', '_show_exp_as_pow', '_can_render', '__weakref__')
+
     def __new__(self, arg=None, symbol_name=None, call=None):
         """
         Expr(expr) creates a copy of expr (this may actually return
@@ -41,141 +84,183 @@ class Expr(object):
         """
         if isinstance(arg, Expr):
             return arg
-        self = object.__new__(Expr)
-        self._hash = None
-        self._symbol = None
-        self._integer = None
-        self._text = None
-        self._args = None
         if symbol_name is not None:
-            self._symbol = symbol_name
+            tag = 0
+            val = symbol_name
         elif isinstance(arg, str):
-            self._text = arg
+            tag = 2
+            val = arg
         elif isinstance(arg, int_types):
-            self._integer = int(arg)
+            tag = 1
+            val = int(arg)
         elif call is not None:
             assert len(call) >= 1
-            self._args = tuple(Expr(obj) for obj in call)
+            tag = 3
+            val = tuple(call)
+            for obj in val:
+                if type(obj) is not Expr:
+                    val = tuple([Expr(obj) for obj in val])
+                    break
+        else:
+            raise ValueError("no content")
+        if tag == 3:
+            return Expr._make(val)
+        obj = _atom_cache.get((tag, val))
+        if obj is not None:
+            return obj
+        if tag == 0 or tag == 2:
+            val = sys.intern(val)
+        self = object.__new__(Expr)
+        self._tag = tag
+        self._head = None
+        self._val = val
+        self._hash = hash(val)
+        self._show_exp_as_pow = None
+        self._can_render = None
+        _atom_cache[(tag, val)] = self
+        return self
+
+    @staticmethod
+    def _make(call):
+        """
+        Creates the non-atomic expression f(a, b, ...) from the tuple
+        call = (f, a, b, ...), whose elements must already be Expr objects.
+        """
+        obj = _call_cache.get(call)
+        if obj is not None:
+            return obj
+        self = object.__new__(Expr)
+        self._tag = 3
+        self._head = call[0]
+        self._val = call[1:]
+        self._hash = hash(call)
+        self._show_exp_as_pow = None
+        self._can_render = None
+        _call_cache[call] = self
         return self
 
     def __eq__(self, other):
-        if type(self) != type(other):
-            return False
-        if hash(self) != hash(other):
-            return False
-        if self._args is not None:
-            if other._args is not None:
-                return self._args == other._args
-            return False
-        if self._symbol is not None:
-            if other._symbol is not None:
-                return self._symbol == other._symbol
-            return False
-        if self._integer is not None:
-            if other._integer is not None:
-                return self._integer == other._integer
+        # Atoms and call nodes are interned, so equal expressions are
+        # almost always the same object; the structural comparison
+        # below is only a fallback.
+        if self is other:
+            return True
+        if type(other) is not Expr:
             return False
-        if self._text is not None:
-            if other._text is not None:
-                return self._text == other._text
+        if self._hash != other._hash:
             return False
-        return False
+        return self._tag == other._tag and self._head == other._head and self._val == other._val
 
     def __ne__(self, other):
-        return not (self == other)
+        return not self.__eq__(other)
 
     def __hash__(self):
-        if self._hash is None:
-            if self._symbol is not None:
-                self._hash = hash(self._symbol)
-            elif self._integer is not None:
-                self._hash = hash(self._integer)
-            elif self._text is not None:
-                self._hash = hash(self._text)
-            else:
-                self._hash = hash(self._args)
         return self._hash
 
+    def __reduce__(self):
+        """
+        Rebuilds the expression through the interning constructors, so
+        that copies and unpickled expressions are the cached instances.
+
+        >>> import copy, pickle
+        >>> expr = Expr(call=(Expr(symbol_name="f"), 1, "text"))
+        >>> copy.copy(expr) is expr and copy.deepcopy(expr) is expr
+        True
+        >>> pickle.loads(pickle.dumps(expr)) is expr
+        True
+        """
+        if self._tag == 3:
+            return (Expr._make, ((self._head,) + self._val,))
+        if self._tag == 0:
+            return (Expr, (None, self._val))
+        return (Expr, (self._val,))
+
+    # Expr objects are immutable, so copies can share the instance
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
     def is_atom(self):
         """Returns True if self is an atom (symbol, integer or text),
         False otherwise."""
-        return self._args is None
+        return self._tag != 3
 
     def is_symbol(self):
-        return self._symbol is not None
+        return self._tag == 0
 
     def is_integer(self):
-        return self._integer is not None
+        return self._tag == 1
 
     def is_text(self):
-        return self._text is not None
+        return self._tag == 2
 
     def head(self):
-        if self._args is None:
+        if self._tag != 3:
             return None
-        return self._args[0]
+        return self._head
 
     def args(self):
-        if self._args is None:
+        if self._tag != 3:
             return None
-        return self._args[1:]
+        return self._val
 
     def __call__(self, *args):
         return Expr(call=((self,) + args))
 
     def __pos__(self):
-        return Pos(self)
+        return Expr._make((Pos, self))
     def __neg__(self):
-        return Neg(self)
+        return Expr._make((Neg, self))
     def __abs__(self):
-        return Abs(self)
+        return Expr._make((Abs, self))
 
     def __add__(self, other):
-        return Add(Expr(self), Expr(other))
+        return Expr._make((Add, self, Expr(other)))
     def __radd__(self, other):
-        return Add(Expr(other), Expr(self))
+        return Expr._make((Add, Expr(other), self))
 
     def __sub__(self, other):
-        return Sub(Expr(self), Expr(other))
+        return Expr._make((Sub, self, Expr(other)))
     def __rsub__(self, other):
-        return Sub(Expr(other), Expr(self))
+        return Expr._make((Sub, Expr(other), self))
 
     def __mul__(self, other):
-        return Mul(Expr(self), Expr(other))
+        return Expr._make((Mul, self, Expr(other)))
     def __rmul__(self, other):
-        return Mul(Expr(other), Expr(self))
+        return Expr._make((Mul, Expr(other), self))
 
     def __div__(self, other):
-        return Div(Expr(self), Expr(other))
+        return Expr._make((Div, self, Expr(other)))
     def __rdiv__(self, other):
-        return Div(Expr(other), Expr(self))
+        return Expr._make((Div, Expr(other), self))
     def __truediv__(self, other):
-        return Div(Expr(self), Expr(other))
+        return Expr._make((Div, self, Expr(other)))
     def __rtruediv__(self, other):
-        return Div(Expr(other), Expr(self))
+        return Expr._make((Div, Expr(other), self))
 
     def __pow__(self, other):
-        return Pow(Expr(self), Expr(other))
+        return Expr._make((Pow, self, Expr(other)))
     def __rpow__(self, other):
-        return Pow(Expr(other), Expr(self))
+        return Expr._make((Pow, Expr(other), self))
 
     def str(self, level=0, **kwargs):
-        if self._symbol is not None:
-            s = str(self._symbol)
-        elif self._integer is not None:
-            s = str(self._integer)
-        elif self._text is not None:
-            s = self._text.replace('"', '\\"')
+        tag = self._tag
+        if tag == 0:
+            s = str(self._val)
+        elif tag == 1:
+            s = str(self._val)
+        elif tag == 2:
+            s = self._val.translate(_str_escape)
             return '"' + s + '"'
-        elif self._args is not None:
-            fstr = self._args[0].str(level, **kwargs)
-            argstrs = [arg.str(level+1, **kwargs) for arg in self._args[1:]]
-            if self._args[0] is Entry:
+        else:
+            fstr = self._head.str(level, **kwargs)
+            argstrs = [arg.str(level+1, **kwargs) for arg in self._val]
+            if self._head is Entry:
                 s = fstr + "(" + ",\n    ".join(argstrs) + ")"
             else:
                 s = fstr + "(" + ", ".join(argstrs) + ")"
-        else:
-            raise ValueError("no content")
         return s
 
     def __str__(self):
@@ -185,785 +270,124 @@ class Expr(object):
         return self.str()
 
     def _all_symbols(self):
-        if self._symbol is not None:
-            return [self]
         symbols = []
-        if self._args is not None:
-            for arg in self._args:
-                arg_symbols = arg._all_symbols()
-                for s in arg_symbols:
-                    symbols.append(s)
+        stack = [self]
+        while stack:
+            expr = stack.pop()
+            if expr._tag == 0:
+                symbols.append(expr)
+            elif expr._tag == 3:
+                stack.extend(reversed(expr._val))
+                stack.append(expr._head)
         return symbols
 
     def all_symbols(self):
-        from collections import OrderedDict
-        symbols = self._all_symbols()
-        return list(OrderedDict.fromkeys(symbols))
+        return list(dict.fromkeys(self._all_symbols()))
 
     # needs work
     def need_parens_in_mul(self):
-        if self.is_atom():
-            if self.is_integer() and self._integer < 0:
+        if self._tag != 3:
+            if self._tag == 1 and self._val < 0:
                 return True
             return False
-        # if self._args[0] in (Pos, Neg):
+        # if self._head in (Pos, Neg):
         #     return True
-        if self._args[0] in (Add, Sub):
+        if self._head in _add_sub_heads:
             return True
         return False
 
     # needs work
     def show_exponential_as_power(self, allow_div=True):
-        if self.is_atom():
+        # allow_div does not currently change the result, so the answer
+        # can be cached on the (immutable) node
+        v = self._show_exp_as_pow
+        if v is None:
+            v = self._show_exp_as_pow = self._show_exponential_as_power(allow_div)
+        return v
+
+    def _show_exponential_as_power(self, allow_div):
+        if self._tag != 3:
             return True
-        head = self._args[0]
+        head = self._head
         if head is Div:
-            if not self._args[-1].is_atom():
+            if self._val[-1]._tag == 3:
                 return False
             allow_div = False
-        if head not in (Pos, Neg, Add, Sub, Mul, Div, Pow, Abs, Sqrt):
+        if head not in _exp_as_power_heads:
             return False
-        for arg in self._args[1:]:
+        for arg in self._val:
             if not arg.show_exponential_as_power(allow_div=allow_div):
                 return False
         return True
 
-    def latex(self, in_small=False, __cache={}):
-        if (self, in_small) in __cache:
-            return __cache[(self, in_small)]
-        else:
-            tex = self._latex(in_small=in_small)
-            __cache[(self, in_small)] = tex
-            return tex
-
-    def _latex(self, in_small=False):
-
-        if self in symbol_latex_table:
-            return symbol_latex_table[self]
-
-        if self.is_atom():
-            if self._symbol is not None:
-                if self._symbol in variable_names:
-                    if len(self._symbol) == 1:
-                        return self._symbol
-                    else:
-                        if self._symbol == "epsilon":
-                            return "\\varepsilon"
-                        return "\\" + self._symbol
-                return "\\operatorname{" + self._symbol + "}"
-            if self._integer is not None:
-                return str(self._integer)
-            if self._text is not None:
-                return "\\text{``" + str(self._text).replace("_","\\_") + "''}"
-            raise NotImplementedError
-
-        head = self._args[0]
-        args = self._args[1:]
-
-        if head in infix_latex_table:
-            argstr = [arg.latex(in_small=in_small) for arg in args]
-            return (" " + infix_latex_table[head] + " ").join(argstr)
-
-        # F(n,x,...) -> F_n(x,...)
-        if head in subscript_call_latex_table:
-            arg0 = args[0].latex(in_small=True)
-            args1 = ", ".join(arg.latex(in_small=in_small) for arg in args[1:])
-            return subscript_call_latex_table[head] + "_{" + arg0 + "}" + "\!\\left(" + args1 + "\\right)"
-
-        if head is Exp:
-            assert len(args) == 1
-            if args[0].show_exponential_as_power():
-                return Pow(ConstE, args[0]).latex(in_small=in_small)
-
-        if head is Div:
-            assert len(args) == 2
-            num, den = args
-            if in_small:
-                numstr = num.latex(in_small=True)
-                denstr = den.latex(in_small=True)
-                if num.need_parens_in_mul():  # fixme!
-                    numstr = "\\left( %s \\right)" % numstr
-                if den.need_parens_in_mul():  # fixme!
-                    denstr = "\\left( %s \\right)" % denstr
-                return numstr + " / " + denstr
-            else:
-                numstr = num.latex()
-                denstr = den.latex()
-                #if num.is_integer() and den.is_integer():
-                #    return "\\frac{" + numstr + "}{" + denstr + "}"
-                #else:
-                return "\\frac{" + numstr + "}{" + denstr + "}"
-
-        argstr = [arg.latex(in_small=in_small) for arg in args]
-        if head is Where:
-            return argstr[0] + "\; \\text{ where } " + ",\,".join(argstr[1:])
-        if head is Pos:
-            assert len(args) == 1
-            return "+" + argstr[0]
-        if head is Neg:
-            assert len(args) == 1
-            return "-" + argstr[0]
-        if head is Add:
-            return " + ".join(argstr)
-        if head is Sub:
-            for i in range(1, len(args)):
-                if not args[i].is_atom() and args[i]._args[0] in (Neg, Sub):
-                    argstr[i] = "\\left(" + argstr[i] + "\\right)"
-            return " - ".join(argstr)
-        if head is Mul:
-            for i in range(len(args)):
-                if args[i].need_parens_in_mul():
-                    argstr[i] = "\\left(" + argstr[i] + "\\right)"
-            return " ".join(argstr)
-        if head is Pow:
-            assert len(args) == 2
-            # remove frac to try to keep it on one line
-            base = args[0]
-            expo = args[1]
-            # todo: more systematic solutions
-            if not base.is_atom() and base.head() in (Sin, Cos, Csc, Tan, Sinh, Cosh, Tanh, DedekindEta):
-                return base.head().latex() + "^{" + expo.latex(in_small=True) + "}" + "\\!\\left(" + base.args()[0].latex(in_small=in_small) + "\\right)"
-            if not base.is_atom() and base.head() is Fibonacci:
-                return "F_{%s}^{%s}" % (base.args()[0].latex(in_small=in_small), expo.latex(in_small=True))
-            if not base.is_atom() and base.head() in (JacobiTheta1, JacobiTheta2, JacobiTheta3, JacobiTheta4) and len(base.args()) == 2:
-                return base.head().latex() + "^{%s}\\!\\left(%s, %s\\right)" % (expo.latex(in_small=True), base.args()[0].latex(), base.args()[1].latex())
-            if not base.is_atom() and base.head() in subscript_call_latex_table and len(base.args()) == 2:
-                h = subscript_call_latex_table[base.head()]
-                s = base.args()[0].latex(in_small=True)
-                e = expo.latex(in_small=True)
-                v = base.args()[1].latex(in_small=in_small)
-                return "%s_{%s}^{%s}\\!\\left(%s\\right)" % (h, s, e, v)
-            basestr = base.latex(in_small=in_small)
-            expostr = expo.latex(in_small=True)
-            if base.is_symbol() or (base.is_integer() and base._integer >= 0) or (not base.is_atom() and base._args[0] in (Abs, Binomial, PrimeNumber, Matrix2x2, Parentheses, Braces, Brackets)):
-                return "{" + basestr + "}^{" + expostr + "}"
-            else:
-                return "{\\left(" + basestr + "\\right)}^{" + expostr + "}"
-        if head is Integral:
-            assert len(args) == 2
-            assert args[1]._args[0] is Tuple
-            _, var, low, high = args[1]._args
-            var = var.latex()
-            low = low.latex(in_small=True)
-            high = high.latex(in_small=True)
-            return "\\int_{%s}^{%s} %s \, d%s" % (low, high, argstr[0], var)
-        if head in (IndefiniteIntegralEqual, RealIndefiniteIntegralEqual, ComplexIndefiniteIntegralEqual):
-            # IndefiniteIntegralEqual(f(z), g(z), z, c)
-            if len(args) == 3:
-                fx, gx, x = args
-                fx = argstr[0]
-                gx = argstr[1]
-                x = argstr[2]
-                return "\\int %s \, d%s = %s + \\mathcal{C}" % (fx, x, gx)
-            elif len(args) == 4:
-                fx, gx, x, c = args
-                fx = argstr[0]
-                gx = argstr[1]
-                x = argstr[2]
-                if x == c:
-                    return "\\int %s \, d%s = %s + \\mathcal{C}" % (fx, x, gx)
-                else:
-                    return "\\int %s \, d%s = %s + \\mathcal{C}, %s = %s" % (fx, x, gx, x, c)
-            else:
-                raise ValueError
-        if head in (Sum, Product):
-            # Sum(f(n), Tuple(n, a, b))
-            # Sum(f(n), Tuple(n, a, b), P(n)) ???
-            # Sum(f(n), n, P(n))
-            if head is Sum:
-                ss = "\\sum"
-            else:
-                ss = "\\prod"
-            # todo: auto-parenthesis for Add/...?
-            if len(args) == 2 and not args[1].is_atom() and args[1]._args[0] is Tuple:
-                _, var, low, high = args[1]._args
-                var = var.latex()
-                low = low.latex(in_small=True)
-                high = high.latex(in_small=True)
-                return ss + ("_{%s=%s}^{%s} %s" % (var, low, high, argstr[0]))
-            elif len(args) == 2:
-                func, var = args
-                return ss + ("_{%s} %s" % (var, argstr[0]))
-            elif len(args) == 3:
-                func, var, cond = args
-                cond = cond.latex(in_small=True)
-                return ss + ("_{%s} %s" % (cond, argstr[0]))
-            else:
-                raise ValueError
-        if head in (DivisorSum, DivisorProduct):
-            if len(args) == 3:
-                formula, var, number = args
-                formula = argstr[0]
-                var = var.latex()
-                number = number.latex(in_small=True)
-                ss = "_{%s \\mid %s} %s" % (var, number, formula)
-            elif len(args) == 4:
-                formula, var, number, cond = args
-                formula = argstr[0]
-                var = var.latex()
-                number = number.latex(in_small=True)
-                cond = cond.latex(in_small=True)
-                #ss = "_{\\begin{matrix} {\\scriptstyle %s \\mid %s} \\\\ {\\scriptstyle %s} \\end{matrix}} %s" % (var, number, cond, formula)
-                ss = "_{%s \\mid %s,\\, %s} %s" % (var, number, cond, formula)
-            else:
-                raise ValueError
-            if head is DivisorSum:
-                return "\\sum" + ss
-            else:
-                return "\\prod" + ss
-        if head in (PrimeSum, PrimeProduct):
-            if len(args) == 2:
-                formula, var = args
-                formula = argstr[0]
-                var = var.latex()
-                ss = "_{%s} %s" % (var, formula)
-            elif len(args) == 3:
-                formula, var, cond = args
-                formula = argstr[0]
-                var = var.latex()
-                cond = cond.latex(in_small=True)
-                ss = "_{%s} %s" % (cond, formula)
-            else:
-                raise ValueError
-            if head is PrimeSum:
-                return "\\sum" + ss
-            else:
-                return "\\prod" + ss
-        if head in (Limit, SequenceLimit, RealLimit, LeftLimit, RightLimit, ComplexLimit, MeromorphicLimit):
-            if len(args) == 3:
-                formula, var, point = args
-                cond = ""
-            elif len(args) == 4:
-                formula, var, point, cond = args
-                cond = ", " + cond.latex(in_small=True)
-            else:
-                raise ValueError
-            var = var.latex()
-            point = point.latex(in_small=True)
-            formula = formula.latex()
-            if (not args[2].is_atom() and args[2].head() not in [Abs]):
-                formula = "\\left[ %s \\right]" % formula
-            if head is LeftLimit:
-                s = "\\lim_{%s \\to {%s}^{-}%s} %s" % (var, point, cond, formula)
-            elif head is RightLimit:
-                s = "\\lim_{%s \\to {%s}^{+}%s} %s" % (var, point, cond, formula)
-            else:
-                s = "\\lim_{%s \\to %s%s} %s" % (var, point, cond, formula)
-            return s
-        if head in (Minimum, Maximum, ArgMin, ArgMax, ArgMinUnique, ArgMaxUnique, Supremum, Infimum, Zeros, UniqueZero, Solutions, UniqueSolution):
-            opname = {Minimum:"\\min", Maximum:"\\max",
-                      ArgMin:"\\operatorname{arg\,min}",ArgMinUnique:"\\operatorname{arg\,min*}",
-                      ArgMax:"\\operatorname{arg\,max}",ArgMaxUnique:"\\operatorname{arg\,max*}",
-                      Infimum:"\\operatorname{inf}", Supremum:"\\operatorname{sup}",
-                      Zeros:"\\operatorname{zeros}\\,", UniqueZero:"\\operatorname{zero*}\\,",
-                      Solutions:"\\operatorname{solutions}\\,", UniqueSolution:"\\operatorname{solution*}\\,"}[head]
-            if head in (Minimum, Maximum, Supremum, Infimum) and len(args) == 1:
-                return "%s\\left(%s\\right)" % (opname, argstr[0])
-            assert len(args) == 3
-            formula, var, predicate = args
-            #var = var.latex()
-            if 0 and predicate.head() is And and len(predicate.args()) > 1:
-                # katex does not support substack
-                predicate = "\\begin{matrix}" + "\\\\".join("\\scriptstyle %s " % s.latex(in_small=True) for s in predicate.args()) + "\\end{matrix}"
-            else:
-                predicate = predicate.latex(in_small=True)
-            if formula.head() in (Add, Sub):
-                formula = "\\left(" + formula.latex() + "\\right)"
-            else:
-                formula = formula.latex()
-            return "\\mathop{%s}\\limits_{%s} %s" % (opname, predicate, formula)
-        if head is ComplexZeroMultiplicity:
-            assert len(args) == 3
-            f, var, point = argstr
-            if args[1] == args[2]:
-                return "\\mathop{\\operatorname{ord}}\\limits_{%s} %s" % (point, f)
-            else:
-                return "\\mathop{\\operatorname{ord}}\\limits_{%s=%s} %s" % (var, point, f)
-        if head is Residue:
-            assert len(args) == 3
-            f, var, point = argstr
-            if args[1] == args[2]:
-                return "\\mathop{\\operatorname{Res}}\\limits_{%s} %s" % (point, f)
-            else:
-                return "\\mathop{\\operatorname{Res}}\\limits_{%s=%s} %s" % (var, point, f)
-        if head in (Derivative, RealDerivative, ComplexDerivative, ComplexBranchDerivative, MeromorphicDerivative):
-            if len(args) == 2:
-                assert args[1]._args[0] is Tuple
-                _, var, point, order = args[1]._args
-            elif len(args) == 3:
-                _, var, point = args
-                order = Expr(1)
-            elif len(args) == 4:
-                _, var, point, order = args
-            if not args[0].is_atom():
-                f = args[0].head()
-                if f.is_symbol() and f not in (Exp, Sqrt) and args[0].args() == (var,):
-                    pointstr = point.latex(in_small=True)
-                    fstr = args[0].head().latex()
-                    if order.is_integer() and order._integer == 0:
-                        return "%s(%s)" % (fstr, pointstr)
-                    if order.is_integer() and order._integer == 1:
-                        return "%s'(%s)" % (fstr, pointstr)
-                    if order.is_integer() and order._integer == 2:
-                        return "%s''(%s)" % (fstr, pointstr)
-                    if order.is_integer() and order._integer == 3:
-                        return "%s'''(%s)" % (fstr, pointstr)
-                    return "{%s}^{(%s)}(%s)" % (fstr, order.latex(), pointstr)
-                if 1 and (f in subscript_call_latex_table and len(args[0].args()) == 2 and args[0].args()[1] == var):
-                    arg0 = args[0].args()[0].latex(in_small=True)
-                    fstr = subscript_call_latex_table[f]
-                    pointstr = point.latex(in_small=True)
-                    if order.is_integer() and order._integer == 0:
-                        return "%s_{%s}(%s)" % (fstr, arg0, pointstr)
-                    if order.is_integer() and order._integer == 1:
-                        return "%s'_{%s}(%s)" % (fstr, arg0, pointstr)
-                    if order.is_integer() and order._integer == 2:
-                        return "%s''_{%s}(%s)" % (fstr, arg0, pointstr)
-                    if order.is_integer() and order._integer == 3:
-                        return "%s'''_{%s}(%s)" % (fstr, arg0, pointstr)
-                    return "{%s}^{(%s)}_{%s}(%s)" % (fstr, order.latex(), arg0, pointstr)
-            varstr = var.latex()
-            pointstr = point.latex(in_small=True)
-            orderstr = order.latex()
-            if var is point:
-                if order.is_integer() and order._integer == 1:
-                    return "\\frac{d}{d %s}\, %s" % (varstr, argstr[0])
-                else:
-                    return "\\frac{d^{%s}}{{d %s}^{%s}} %s" % (orderstr, varstr, orderstr, argstr[0])
-            else:
-                if order.is_integer() and order._integer == 1:
-                    return "\\left[ \\frac{d}{d %s}\, %s \\right]_{%s = %s}" % (varstr, argstr[0], varstr, pointstr)
-                else:
-                    return "\\left[ \\frac{d^{%s}}{{d %s}^{%s}} %s \\right]_{%s = %s}" % (orderstr, varstr, orderstr, argstr[0], varstr, pointstr)
-        if head is Sqrt:
-            assert len(args) == 1
-            return "\\sqrt{" + argstr[0] + "}"
-        if head is Abs:
-            assert len(args) == 1
-            return "\\left|" + argstr[0] + "\\right|"
-        if head is Floor:
-            assert len(args) == 1
-            return "\\left\\lfloor " + argstr[0] + " \\right\\rfloor"
-        if head is Ceil:
-            assert len(args) == 1
-            return "\\left\\lceil " + argstr[0] + " \\right\\rceil"
-        if head is Tuple:
-            return "\\left(" + ", ".join(argstr) + "\\right)"
-        if head is Set:
-            return "\\left\{" + ", ".join(argstr) + "\\right\}"
-        if head is List:
-            return "\\left[" + ", ".join(argstr) + "\\right]"
-        # todo: unify subscript cases
-        if head is BernoulliB:
-            assert len(args) == 1
-            return "B_{" + argstr[0] + "}"
-        if head is Fibonacci:
-            assert len(args) == 1
-            return "F_{" + args[0].latex(in_small=True) + "}"
-        if head is BellNumber:
-            assert len(args) == 1
-            return "B_{" + argstr[0] + "}"
-        if head is HarmonicNumber:
-            assert len(args) == 1
-            return "H_{" + argstr[0] + "}"
-        if head is PrimeNumber:
-            assert len(args) == 1
-            return "p_{" + argstr[0] + "}"
-        if head is RiemannZetaZero:
-            assert len(args) == 1
-            return "\\rho_{" + argstr[0] + "}"
-        if head is DirichletLZero:
-            assert len(args) == 2
-            return "\\rho_{%s, %s}" % (argstr[0], argstr[1])
-        if head is LegendrePolynomialZero:
-            assert len(args) == 2
-            return "x_{%s,%s}" % (argstr[0], argstr[1])
-        if head is GaussLegendreWeight:
-            assert len(args) == 2
-            return "w_{%s,%s}" % (argstr[0], argstr[1])
-        if head is GeneralizedBernoulliB:
-            assert len(args) == 2
-            return "B_{%s,%s}" % (argstr[0], argstr[1])
-        if head in (BesselJ, BesselY, BesselI, BesselK, HankelH1, HankelH2):
-            assert len(args) == 2
-            n, z = args
-            nstr = n.latex(in_small=True)
-            zstr = z.latex(in_small)
-            fsym = {BesselJ:"J", BesselI:"I", BesselY:"Y", BesselK:"K", HankelH1:"H^{(1)}", HankelH2:"H^{(2)}"}[head]
-            return fsym + "_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
-        if head in (BesselJDerivative, BesselYDerivative, BesselIDerivative, BesselKDerivative):
-            assert len(args) == 3
-            n, z, r = args
-            nstr = n.latex(in_small=True)
-            zstr = z.latex(in_small)
-            rstr = r.latex(in_small)
-            fsym = {BesselJDerivative:"J", BesselIDerivative:"I", BesselYDerivative:"Y", BesselKDerivative:"K", HankelH1:"H^{(1)}", HankelH2:"H^{(2)}"}[head]
-            if r.is_integer() and r._integer >= 0 and r._integer <= 3:
-                return fsym + ("'" * r._integer) + "_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
-            else:
-                return fsym + "^{(" + rstr + ")}_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
-        if head in (CoulombF, CoulombG):
-            assert len(args) == 3
-            l, eta, z = args
-            lstr = l.latex(in_small=True)
-            etastr = eta.latex(in_small=True)
-            zstr = z.latex()
-            F = {CoulombF:"F", CoulombG:"G"}[head]
-            return F + ("_{%s,%s}\!\\left(" % (lstr, etastr)) + zstr + "\\right)"
-        if head is CoulombH:
-            assert len(args) == 4
-            omega, l, eta, z = args
-            if omega.is_integer():
-                omegastr = "+"
-                if omega._integer == -1:
-                    omegastr = "-"
-            else:
-                omegastr = omega.latex(in_small=True)
-            lstr = l.latex(in_small=True)
-            etastr = eta.latex(in_small=True)
-            zstr = z.latex()
-            return "H" + ("^{%s}_{%s,%s}\!\\left(" % (omegastr, lstr, etastr)) + zstr + "\\right)"
-        if head is CoulombC:
-            l, eta = args
-            lstr = l.latex(in_small=True)
-            etastr = eta.latex()
-            return "C_{%s}\!\\left(%s\\right)" % (lstr, etastr)
-        if head is CoulombSigma:
-            l, eta = args
-            lstr = l.latex(in_small=True)
-            etastr = eta.latex()
-            return "\\sigma_{%s}\!\\left(%s\\right)" % (lstr, etastr)
-        if head in (Factorial, DoubleFactorial):
-            assert len(args) == 1
-            ss = "!"
-            if head is DoubleFactorial:
-                ss += "!"
-            if args[0].is_symbol() or (args[0].is_integer() and args[0]._integer >= 0):
-                return argstr[0] + " " + ss
-            else:
-                return "\\left(" + argstr[0] + "\\right)" + ss
-        if head is RisingFactorial:
-            assert len(args) == 2
-            return "\\left(" + argstr[0] + "\\right)_{" + argstr[1] + "}"
-        if head is FallingFactorial:
-            assert len(args) == 2
-            return "\\left(" + argstr[0] + "\\right)^{\\underline{" + argstr[1] + "}}"
-        if head is Binomial:
-            assert len(args) == 2
-            return "{" + argstr[0] + " \\choose " + argstr[1] + "}"
-        if head is StirlingCycle:
-            assert len(args) == 2
-            return "\\left[{%s \\atop %s}\\right]" % (argstr[0], argstr[1])
-        if head is StirlingS1:
-            assert len(args) == 2
-            return "s\!\\left(%s, %s\\right)" % (argstr[0], argstr[1])
-        if head is StirlingS2:
-            assert len(args) == 2
-            return "\\left\\{{%s \\atop %s}\\right\\}" % (argstr[0], argstr[1])
-        if head is LambertW:
-            assert len(args) in (2,3)
-            if len(args) == 2:
-                n, z = args
-                nstr = n.latex(in_small=True)
-                zstr = z.latex(in_small)
-                return "W_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
-            else:
-                n, z, r = args
-                nstr = n.latex(in_small=True)
-                zstr = z.latex(in_small)
-                rstr = r.latex(in_small)
-                if r.is_integer() and r._integer >= 0 and r._integer <= 3:
-                    return "W" + ("'" * r._integer) + "_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
-                else:
-                    return "W" + "^{(" + rstr + ")}_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
-        if head is LambertWPuiseuxCoefficient:
-            assert len(args) == 1
-            return "{\\mu}_{" + argstr[0] + "}"
-        if head is AsymptoticTo:
-            assert len(argstr) == 4
-            return "%s \\sim %s, \; %s \\to %s" % tuple(argstr)
-        if head is And:
-            for i in range(len(args)):
-                if (not args[i].is_atom()) and args[i].head() in (And, Or):
-                    argstr[i] = "\\left(%s\\right)" % argstr[i]
-            if in_small:
-                # see ff190c
-                #return "\\text{ and }".join(argstr)
-                return ",\\,".join(argstr)
-            else:
-                return " \\,\\mathbin{\\operatorname{and}}\\, ".join(argstr)
-                #return " \\,\\land\\, ".join(argstr)
-        if head is Or:
-            for i in range(len(args)):
-                if (not args[i].is_atom()) and args[i].head() in (And, Or, Not):
-                    argstr[i] = "\\left(%s\\right)" % argstr[i]
-            return " \\,\\mathbin{\\operatorname{or}}\\, ".join(argstr)
-            #return " \\,\\lor\\, ".join(argstr)
-        if head is Not:
-            assert len(args) == 1
-            return " \\operatorname{not} \\left(%s\\right)" % argstr[0]
-            #return " \\neg \\left(%s\\right)" % argstr[0]
-        if head is Implies:
-            return " \\implies ".join("\\left(%s\\right)" % s for s in argstr)
-        if head is Equivalent:
-            return " \\iff ".join("\\left(%s\\right)" % s for s in argstr)
-        if head is EqualAndElement:
-            assert len(args) == 3
-            return "%s = %s \\in %s" % (argstr[0], argstr[1], argstr[2])
-        if head is KroneckerDelta:
-            assert len(args) == 2
-            xstr = args[0].latex(in_small=True)
-            ystr = args[1].latex(in_small=True)
-            return "\delta_{(%s,%s)}" % (xstr, ystr)
-        if head in (LegendreSymbol, JacobiSymbol, KroneckerSymbol):
-            if 0 and in_small:
-                return "(%s \\mid %s)" % (argstr[0], argstr[1])
-            else:
-                return "\\left( \\frac{%s}{%s} \\right)" % (argstr[0], argstr[1])
-        if head is CongruentMod:
-            return "%s \\equiv %s \\pmod {%s}" % (argstr[0], argstr[1], argstr[2])
-        if head is Odd:
-            return "%s \\text{ odd}" % (argstr[0])
-        if head is Even:
-            return "%s \\text{ even}" % (argstr[0])
-        if head is ZZGreaterEqual:
-            assert len(args) == 1
-            # if args[0].is_integer():
-            #    return "\{%s, %s, \ldots\}" % (args[0]._integer, args[0]._integer + 1)
-            return "\\mathbb{Z}_{\ge %s}" % argstr[0]
-        if head is ZZLessEqual:
-            assert len(args) == 1
-            if args[0].is_integer():
-                return "\{%s, %s, \ldots\}" % (args[0]._integer, args[0]._integer - 1)
-            return "\\mathbb{Z}_{\le %s}" % argstr[0]
-        if head is ZZBetween:
-            assert len(args) == 2
-            if args[0].is_integer():
-                return "\{%s, %s, \ldots %s\}" % (argstr[0], args[0]._integer + 1, argstr[1])
-            else:
-                return "\{%s, %s + 1, \ldots %s\}" % (argstr[0], argstr[0], argstr[1])
-        if head in (ClosedInterval, OpenInterval, ClosedOpenInterval, OpenClosedInterval):
-            assert len(args) == 2
-            #arg0 = args[0].latex(in_small=True)
-            #arg1 = args[1].latex(in_small=True)
-            arg0 = args[0].latex(in_small=in_small)
-            arg1 = args[1].latex(in_small=in_small)
-            if head is ClosedInterval:
-                return "\\left[%s, %s\\right]" % (arg0, arg1)
-            if head is OpenInterval:
-                return "\\left(%s, %s\\right)" % (arg0, arg1)
-            if head is ClosedOpenInterval:
-                return "\\left[%s, %s\\right)" % (arg0, arg1)
-            if head is OpenClosedInterval:
-                return "\\left(%s, %s\\right]" % (arg0, arg1)
-        if head is RealBall:
-            assert len(args) == 2
-            return "\\left[%s \\pm %s\\right]" % (args[0].latex(in_small=True), args[1].latex(in_small=True))
-        if head is BernsteinEllipse:
-            assert len(args) == 1
-            return "\\mathcal{E}_{" + argstr[0] + "}"
-        if head is Lattice:
-            return "\\Lambda_{(%s)}" % (", ".join(argstr))
-        if head is DomainCodomain:
-            assert len(args) == 2
-            #return "%s \\rightarrow %s" % (argstr[0], argstr[1])
-        if head is Conjugate:
-            assert len(args) == 1
-            return "\\overline{%s}" % argstr[0]
-        if head is SetBuilder:
-            assert len(args) == 3
-            return "\\left\\{ %s : %s \\right\\}" % (argstr[0], argstr[2])
-        if head is Cardinality:
-            assert len(args) == 1
-            #return "\\text{card }" + argstr[0]
-            return "\\# " + argstr[0]
-            #return "\\left|" + argstr[0] + "\\right|"
-        if head is Decimal:
-            assert len(args) == 1
-            text = args[0]._text
-            if "e" in text:
-                mant, expo = text.split("e")
-                expo = expo.lstrip("+")
-                text = mant + " \\cdot 10^{" + expo + "}"
-            return text
-        if head is Matrix2x2:
-            assert len(args) == 4
-            return r"\begin{pmatrix} %s & %s \\ %s & %s \end{pmatrix}" % tuple(argstr)
-        if head is Matrix2x1:
-            assert len(args) == 2
-            return r"\begin{pmatrix} %s \\ %s \end{pmatrix}" % tuple(argstr)
-        if head is ModularGroupAction:
-            assert len(args) == 2
-            return "%s \\circ %s" % tuple(argstr)
-        if head is PrimitiveReducedPositiveIntegralBinaryQuadraticForms:
-            assert len(args) == 1
-            return "\\mathcal{Q}^{*}_{%s}" % argstr[0]
-        if head is HypergeometricUStarRemainder:
-            assert len(args) == 4
-            return "R_{%s}\!\\left(%s,%s,%s\\right)" % tuple(argstr)
-        if head is DirichletCharacter:
-            if len(args) == 2:
-                return "\\chi_{%s}(%s, \\cdot)" % tuple(argstr)
-            elif len(args) == 3:
-                return "\\chi_{%s}(%s, %s)" % tuple(argstr)
-            else:
-                raise ValueError
-        if head is DirichletGroup:
-            #return "\\{\\chi_{%s}\\}" % argstr[0]
-            return "G_{%s}" % argstr[0]
-        if head is PrimitiveDirichletCharacters:
-            return "G_{%s}^{\\text{primitive}}" % argstr[0]
-        if head is GaussSum:
-            assert len(args) == 2
-            return "G_{" + argstr[0] + "}" + "\!\\left(" + argstr[1] + "\\right)"
-        if head is StieltjesGamma:
-            arg0 = args[0].latex(in_small=True)
-            if len(args) == 1:
-                return "\\gamma_{%s}" % arg0
-            if len(args) == 2:
-                return "\\gamma_{%s}\\!\\left(%s\\right)" % (arg0, argstr[1])
-        if head is StirlingSeriesRemainder:
-            assert len(args) == 2
-            return "R_{%s}\!\\left(%s\\right)" % tuple(argstr)
-        if head is FormalPowerSeries:
-            assert len(args) == 2
-            return "%s[[%s]]" % tuple(argstr)
-        if head is FormalLaurentSeries:
-            assert len(args) == 2
-            return "%s(\!(%s)\!)" % tuple(argstr)
-        if head is SeriesCoefficient:
-            assert len(args) == 3
-            return "[{%s}^{%s}] %s" % (argstr[1], argstr[2], argstr[0])
-        if head is FormalGenerator:
-            assert len(args) == 2
-            return "%s \\text{ is the generator of } %s" % (argstr[0], argstr[1])
-        if head is Parentheses:
-            assert len(args) == 1
-            return "\\left(" + args[0].latex() + "\\right)"
-        if head is Brackets:
-            assert len(args) == 1
-            return "\\left[" + args[0].latex() + "\\right]"
-        if head is Braces:
-            assert len(args) == 1
-            return "\\left\\{" + args[0].latex() + "\\right\\}"
-        if head is Call:
-            return argstr[0] + "\!\\left(" + ", ".join(argstr[1:]) + "\\right)"
-        if head is Subscript:
-            assert len(args) == 2
-            return "{" + argstr[0] + "}_{" + args[1].latex(in_small=True) + "}"
-        if head is Spectrum and args[0].head() is Matrix2x2:
-            assert len(args) == 1
-            return "\\operatorname{spec}" + argstr[0]
-        if head is Det and args[0].head() is Matrix2x2:
-            assert len(args) == 1
-            return "\\operatorname{det}" + argstr[0]
-        if head is ForAll:
-            assert len(args) == 3
-            return "\\text{for all } %s: %s, %s" % (argstr[0], argstr[1], argstr[2])
-        if head is Exists:
-            assert len(args) == 2
-            return "\\text{there exists } %s: %s" % (argstr[0], argstr[1])
-        if head is Cases:
-            s = "\\begin{cases} "
-            for arg in args:
-                assert arg.head() is Tuple
-                v, c = arg.args()
-                #v = v.latex(in_small=True)
-                v = v.latex(in_small=in_small)
-                if c is Otherwise:
-                    c = "\\text{otherwise}"
-                else:
-                    #c = c.latex(in_small=True)
-                    c = c.latex(in_small=in_small)
-                s += "%s, & %s\\\\" % (v, c)
-            s += " \\end{cases}"
-            return s
-        if head is DiscreteLog:
-            n, b, p = args
-            n, b, p = argstr[0], b.latex(in_small=True), argstr[2]
-            return "\\log_{%s}\!\\left(%s\\right) \\bmod %s" % (b, n, p)
-        if head is ConreyGenerator:
-            return "g_{%s}" % argstr[0]
-        if head is QSeriesCoefficient:
-            fun, tau, q, n, qdef = argstr
-            return "[%s^{%s}] %s \; \\left(%s\\right)" % (q, n, fun, qdef)
-        if head is EqualQSeriesEllipsis:
-            fun, tau, q, ser, qdef = argstr
-            return "%s = %s + \\ldots \; \\text{ where } %s" % (fun, ser, qdef)
-        if head is Description:
-            s = ""
-            for arg in args:
-                if arg._text is not None:
-                    s += "\\text{ " + arg._text + " }"
-                else:
-                    s += arg.latex()
-            return s
-        fstr = self._args[0].latex()
-        if in_small:
-            spacer = ""
-        else:
-            spacer = "\\!"
-        s = fstr + spacer + "\\left(" + ", ".join(argstr) + "\\right)"
-        return s
+    def latex(self, in_small=False):
+        return _latex_cached(self, in_small)
 
     def _can_render_html(self):
-        if self.is_integer():
-            return True
-        if self.head() is Decimal:
+        v = self._can_render
+        if v is None:
+            v = self._can_render = self._can_render_html_uncached()
+        return v
+
+    def _can_render_html_uncached(self):
+        if self._tag == 1:
             return True
-        if self.head() is Div and self.args()[0].is_integer() and self.args()[1].is_integer():
+        head = self._head
+        if head is Decimal:
             return True
-        if self.head() is Tuple:
-            return all(arg._can_render_html() for arg in self.args())
-        if self.head() is Set:
-            return all(arg._can_render_html() for arg in self.args())
+        if head is Div:
+            args = self._val
+            return args[0]._tag == 1 and args[1]._tag == 1
+        if head is Tuple or head is Set:
+            return all(arg._can_render_html() for arg in self._val)
         return False
 
     def html(self, display=False, avoid_latex=False, single=False):
-        katex = katex_function[0]
-        if self.is_atom():
-            if avoid_latex and self.is_integer():
-                return str(self._integer)
+        # the active KaTeX function is part of the cache key, so swapping
+        # katex_function[0] never serves HTML rendered by the old one
+        return _html_cached(self, display, avoid_latex, single, katex_function[0])
+
+    def _html(self, display, avoid_latex, single, katex):
+        if self._tag != 3:
+            if avoid_latex and self._tag == 1:
+                return str(self._val)
             return katex(self.latex(), display=display)
-        if self.head() is Decimal and avoid_latex:
-            text = self.args()[0]._text
-            if "e" in text:
-                mant, expo = text.split("e")
-                expo = expo.lstrip("+")
-                text = mant + " &middot; 10<sup>" + expo + "</sup>"
-            return text
-        if self.head() is Div and avoid_latex and self.args()[0].is_integer() and self.args()[1].is_integer():
-            p, q = self.args()
-            return "%s/%s" % (str(self.args()[0]._integer), str(self.args()[1]._integer))
-        if self.head() is Neg and avoid_latex and self.args()[0]._can_render_html():
-            return "-" + self.args()[0].html(display=display, avoid_latex=True)
-        if self.head() is Tuple and avoid_latex and self._can_render_html():
-            return "(" + ", ".join(a.html(display=display, avoid_latex=True) for a in self.args()) + ")"
-        if self.head() is Set and avoid_latex and self._can_render_html():
-            return "{" + ", ".join(a.html(display=display, avoid_latex=True) for a in self.args()) + "}"
-        if self.head() is Table:
+        head = self._head
+        args = self._val
+        if avoid_latex:
+            if head is Decimal:
+                mant, expo = _decimal_parts(args[0]._val)
+                if expo is None:
+                    return mant
+                return mant + " &middot; 10<sup>" + expo + "</sup>"
+            if head is Div and args[0]._tag == 1 and args[1]._tag == 1:
+                return f"{args[0]._val}/{args[1]._val}"
+            if head is Neg and args[0]._can_render_html():
+                return "-" + args[0].html(display=display, avoid_latex=True)
+            if head is Tuple and self._can_render_html():
+                return "(" + ", ".join(a.html(display=display, avoid_latex=True) for a in args) + ")"
+            if head is Set and self._can_render_html():
+                return "{" + ", ".join(a.html(display=display, avoid_latex=True) for a in args) + "}"
+        if head is Table:
             return self.html_Table()
-        if self.head() is Formula:
-            return katex(self._args[1].latex())
-        if self.head() is References:
+        if head is Formula:
+            return katex(args[0].latex())
+        if head is References:
             return self.html_References()
-        if self.head() is Assumptions:
+        if head is Assumptions:
             return self.html_Assumptions()
-        if self.head() is Description:
+        if head is Description:
             return self.html_Description(display=display)
-        if self.head() is SymbolDefinition:
+        if head is SymbolDefinition:
             return self.html_SymbolDefinition()
-        if self.head() is Image:
+        if head is Image:
             return self.html_Image(single=single)
         return katex(self.latex(), display=display)
 
     def html_Image(self, single=False):
         description, image = self.args()
-        path = image.args()[0]._text
-        s = ""
-        s += """<div style="text-align:center; margin:0.6em 0.4em 0.0em 0.2em">"""
-        s += """<span style="font-size:85%; color:#888">Image:</span> """
-        s += description.html()
+        path = image.args()[0]._val
+        parts = [_html_image_head, description.html()]
 
         imgid = path
 
@@ -972,17 +396,17 @@ class Expr(object):
         full_size = "400px"
 
         if single and 0:
-            s += """<div style="text-align:center; padding-right:1em">"""
-            s += """<img id="%s", src="../../img/%s.svg" style="height:%s; margin-top:0.3em; margin-bottom:0px"/>""" % (imgid, path, full_size)
-            s += """</div>"""
+            parts.append("""<div style="text-align:center; padding-right:1em">""")
+            parts.append(f"""<img id="{imgid}", src="../../img/{path}.svg" style="height:{full_size}; margin-top:0.3em; margin-bottom:0px"/>""")
+            parts.append("""</div>""")
         else:
-            s += """<button style="margin:0 0 0 0.3em" onclick="toggleBig('%s', '../../img/%s_small.svg', '../../img/%s.svg')">Big &#x1F50D;</button>""" % (imgid, path, path)
-            s += """<div style="text-align:center; padding-right:1em;">"""
-            s += """<img id="%s", src="../../img/%s_small.svg" style="width:%s; max-width:100%%; margin-top:0.3em; margin-bottom:0px"/>""" % (imgid, path, thumb_size)
-            s += """</div>"""
+            parts.append(f"""<button style="margin:0 0 0 0.3em" onclick="toggleBig('{imgid}', '../../img/{path}_small.svg', '../../img/{path}.svg')">Big &#x1F50D;</button>"""
+                """<div style="text-align:center; padding-right:1em;">"""
+                f"""<img id="{imgid}", src="../../img/{path}_small.svg" style="width:{thumb_size}; max-width:100%; margin-top:0.3em; margin-bottom:0px"/>"""
+                """</div>""")
 
-        s += """</div>"""
-        return s
+        parts.append("""</div>""")
+        return "".join(parts)
 
 
     def html_Table(self):
@@ -995,62 +419,64 @@ class Expr(object):
         if split is None:
             split = 1
         else:
-            split = split.args()[0]._integer
+            split = split.args()[0]._val
+        rows = data.args()
         if heads is None:
-            cols = len(data.args()[0].args())
+            cols = len(rows[0].args())
         else:
             cols = len(heads.args())
-        num = len(data.args())
+        num = len(rows)
         innum = num // split
-        s = """<div style="overflow-x:auto;">"""
-        s += """<table align="center" style="border:0; background-color:#fff;">"""
-        s += """<tr style="border:0; background-color:#fff">"""
+        parts = ["""<div style="overflow-x:auto;">"""]
+        parts.append("""<table align="center" style="border:0; background-color:#fff;">""")
+        parts.append("""<tr style="border:0; background-color:#fff">""")
         j = 0
         for outer in range(split):
-            s += """<td style="border:0; background-color:#fff; vertical-align:top;">"""
-            s += """<table style="float: left; margin-right: 1em;">"""
+            parts.append("""<td style="border:0; background-color:#fff; vertical-align:top;">""")
+            parts.append("""<table style="float: left; margin-right: 1em;">""")
             if heads is not None:
-                s += "<tr>"
+                parts.append("<tr>")
                 for col in heads.args():
                     # the nowrap is a hack to avoid "n \ k" breaking
-                    s += """<th style="white-space:nowrap;">""" + col.html(display=False, avoid_latex=True) + "</th>"
-                s += "</tr>"
+                    parts.append("""<th style="white-space:nowrap;">""" + col.html(display=False, avoid_latex=True) + "</th>")
+                parts.append("</tr>")
             if outer == split-1:
                 end = num
             else:
                 end = innum*(outer+1)
-            for row in data.args()[innum*outer : end]:
-                s += "<tr>"
-                if row.head() is TableSection:
-                    s += """<td colspan="%i" style="text-align:center; font-weight: bold">%s</td>""" % (cols, row.args()[0]._text)
+            for row in rows[innum*outer : end]:
+                cells = row.args()
+                parts.append("<tr>")
+                if row._head is TableSection:
+                    parts.append(f"""<td colspan="{cols}" style="text-align:center; font-weight: bold">{cells[0]._val}</td>""")
                 else:
                     if colheads is not None:
                         col = colheads.args()[j]
-                        s += "<th>" + col.html(display=False, avoid_latex=True) + "</th>"
-                    for i, col in enumerate(row.args()):
-                        s += "<td>" + col.html(display=False, avoid_latex=True) + "</td>"
-                s += "</tr>"
+                        parts.append("<th>" + col.html(display=False, avoid_latex=True) + "</th>")
+                    for col in cells:
+                        parts.append("<td>" + col.html(display=False, avoid_latex=True) + "</td>")
+                parts.append("</tr>")
                 j += 1
-            s += """</table>"""
-            s += "</td>"
-        s += "</tr></table></div>"
+            parts.append("""</table>""")
+            parts.append("</td>")
+        parts.append("</tr></table></div>")
         if rel is not None:
-            s += """<div style="text-align:center; margin-top: 0.5em">"""
-            s += Description("Table data:", rel.args()[0], " such that ", rel.args()[1]).html(display=True)
-            s += """</div>"""
-        return s
+            parts.append("""<div style="text-align:center; margin-top: 0.5em">""")
+            parts.append(Description("Table data:", rel.args()[0], " such that ", rel.args()[1]).html(display=True))
+            parts.append("""</div>""")
+        return "".join(parts)
 
     def html_References(self):
-        s = ""
-        s += """<div class="entrysubhead">References:</div>"""
-        s += "<ul>"
-        for ref in self._args[1:]:
-            s += "<li>%s</li>" % ref._text
-        s += "</ul>"
-        return s
+        parts = []
+        parts.append("""<div class="entrysubhead">References:</div>""")
+        parts.append("<ul>")
+        for ref in self._val:
+            parts.append(f"<li>{ref._val}</li>")
+        parts.append("</ul>")
+        return "".join(parts)
 
     def html_Assumptions(self):
-        s = ""
+        parts = []
         #s += """<div class="entrysubhead">Assumptions:</div>"""
 
         #for arg in self.args():
@@ -1058,176 +484,167 @@ class Expr(object):
         #return s
         num = 1
         for arg in self.args():
-            s += """<div style="text-align:center; margin:0.8em">"""
+            parts.append("""<div style="text-align:center; margin:0.8em">""")
             if num == 1:
                 strcond = "Assumptions"
             else:
                 strcond = "Alternative assumptions"
-            s += """<span style="font-size:85%; color:#888; margin-right:0.8em">""" + strcond + """:</span>"""
-            s += arg.html(display=False)
-            s += """</div>"""
+            parts.append("""<span style="font-size:85%; color:#888; margin-right:0.8em">""" + strcond + """:</span>""")
+            parts.append(arg.html(display=False))
+            parts.append("""</div>""")
             num += 1
-        return s
+        return "".join(parts)
 
     def html_Description(self, display=False):
-        s = ""
+        parts = []
         if display:
-            s += """<div style="text-align:center; margin:0.6em">"""
+            parts.append("""<div style="text-align:center; margin:0.6em">""")
         for arg in self.args():
             if arg.is_text():
-                if arg._text and arg._text[0] in (",", ".", ";"):
-                    s = s.rstrip()
-                s += arg._text
-            elif (not arg.is_atom()) and arg.head() is SourceForm:
-                s += "<tt>%s</tt>" % str(arg.args()[0])
-            elif (not arg.is_atom()) and arg.head() is EntryReference:
-                id = arg.args()[0]._text
-                s += """<a href="../../entry/%s/">%s</a>""" % (id, id)
+                if arg._val and arg._val[0] in (",", ".", ";"):
+                    while parts and not parts[-1].rstrip():
+                        parts.pop()
+                    if parts:
+                        parts[-1] = parts[-1].rstrip()
+                parts.append(arg._val)
+            elif arg._head is SourceForm:
+                parts.append(f"<tt>{arg.args()[0]}</tt>")
+            elif arg._head is EntryReference:
+                id = arg.args()[0]._val
+                parts.append(f"""<a href="../../entry/{id}/">{id}</a>""")
             else:
-                s += arg.html(avoid_latex=True)
-            s += " "
+                parts.append(arg.html(avoid_latex=True))
+            parts.append(" ")
         if display:
-            s += """</div>"""
-        return s
+            parts.append("""</div>""")
+        return "".join(parts)
 
     def html_SymbolDefinition(self):
         symbol, example, description = self.args()
-        s = ""
-        s += """<div style="text-align:center; margin:0.6em">"""
-        s += """<span style="font-size:85%; color:#888">Symbol:</span> """
-        s += """<tt><a href="../../symbol/%s/">%s</a></tt>""" % (symbol._symbol, symbol._symbol)
-        s += """ <span style="color:#888">&mdash;</span> """
-        s += example.html()
-        s += """ <span style="color:#888">&mdash;</span> """
-        s += description._text
-        s += """</div>"""
-        return s
+        return "".join([_html_symbol_head,
+            f"""<tt><a href="../../symbol/{symbol._val}/">{symbol._val}</a></tt>""",
+            _html_mdash, example.html(), _html_mdash, description._val,
+            """</div>"""])
 
     def get_arg_with_head(self, head):
+        # atoms have _head None, so this only matches calls
         for arg in self.args():
-            if not arg.is_atom() and (arg.head() is head):
+            if arg._head is head:
                 return arg
         return None
 
     def id(self):
         id = self.get_arg_with_head(ID)
-        return id._args[1]._text
+        return id._val[0]._val
 
     def title(self):
         title = self.get_arg_with_head(Title)
-        return title._args[1]._text
+        return title._val[0]._val
 
     def entry_html(self, single=False, entry_dir="../../entry/", symbol_dir="../../symbol/", default_visible=False):
         id = self.id()
         all_tex = []
-        image_downloads = []
-        s = ""
-        s += """<div class="entry">"""
+        image_src = None
+        parts = ["""<div class="entry">"""]
         if single:
-            s += """<div style="padding-top:0.4em">"""
+            parts.append("""<div style="padding-top:0.4em">""")
         else:
-            s += """<div style="float:left; margin-top:0.0em; margin-right:0.3em">"""
-            s += """<a href="%s%s/" style="margin-left:3pt; font-size:85%%">%s</a> <span></span><br/>""" % (entry_dir, id, id)
-            s += """<button style="margin-top:0.2em; margin-bottom: 0.1em;" onclick="toggleVisible('%s:info')">Details</button>""" % id
-            s += """</div>"""
-            s += """<div>"""
-
-        args = self.args()
-        args = [arg for arg in args if arg.head() not in (ID, Variables)]
-
-        for arg in args:
-            if arg.head() is Image:
-                src = arg.get_arg_with_head(ImageSource).args()[0]._text
-                image_downloads.append(src)
+            parts.append("""<div style="float:left; margin-top:0.0em; margin-right:0.3em">"""
+                f"""<a href="{entry_dir}{id}/" style="margin-left:3pt; font-size:85%">{id}</a> <span></span><br/>"""
+                f"""<button style="margin-top:0.2em; margin-bottom: 0.1em;" onclick="toggleVisible('{id}:info')">Details</button>"""
+                """</div><div>""")
+
+        # Select the displayed items, the first image source and the
+        # TeX listing in a single pass
+        args = []
+        for arg in self.args():
+            head = arg._head
+            if head is ID or head is Variables:
+                continue
+            args.append(arg)
+            if head is Image:
+                if image_src is None:
+                    image_src = arg.get_arg_with_head(ImageSource).args()[0]._val
+            elif head is Formula or head is Assumptions:
+                for arg2 in arg.args():
+                    all_tex.append(arg2.latex())
 
         # First item is always visible
-        s += args[0].html(display=True, single=single)
-        s += "</div>"
+        parts.append(args[0].html(display=True, single=single))
+        parts.append("</div>")
 
         # Remaining items may be hidden beneath the fold
         if single:
-            s += """<div id="%s:info" style="padding: 1em; clear:both">""" % id
+            parts.append(f"""<div id="{id}:info" style="padding: 1em; clear:both">""")
         else:
             if default_visible:
-                s += """<div id="%s:info" style="display:visible; padding: 1em; clear:both">""" % id
+                parts.append(f"""<div id="{id}:info" style="display:visible; padding: 1em; clear:both">""")
             else:
-                s += """<div id="%s:info" style="display:none; padding: 1em; clear:both">""" % id
-
-        if image_downloads:
-            src = image_downloads[0]
-            s += """<div style="text-align:center; margin-top:0; margin-bottom:1.1em">"""
-            s += """<span style="font-size:85%; color:#888">Download:</span> """
-            s += """<a href="../../img/%s_small.png">png (small)</a>""" % src
-            s += """ <span style="color:#888">&mdash;</span> """
-            s += """<a href="../../img/%s_medium.png">png (medium)</a>""" % src
-            s += """ <span style="color:#888">&mdash;</span> """
-            s += """<a href="../../img/%s_large.png">png (large)</a>""" % src
-            s += """ <span style="color:#888">&mdash;</span> """
-            s += """<a href="../../img/%s_small.pdf">pdf (small)</a>""" % src
-            s += """ <span style="color:#888">&mdash;</span> """
-            s += """<a href="../../img/%s.pdf">pdf (medium/large)</a>""" % src
-            s += """ <span style="color:#888">&mdash;</span> """
-            s += """<a href="../../img/%s_small.svg">svg (small)</a>""" % src
-            s += """ <span style="color:#888">&mdash;</span> """
-            s += """<a href="../../img/%s.svg">svg (medium/large)</a>""" % src
-            s += """</div>"""
+                parts.append(f"""<div id="{id}:info" style="display:none; padding: 1em; clear:both">""")
+
+        if image_src is not None:
+            src = image_src
+            parts.append(_html_downloads_head + _html_mdash.join([
+                f"""<a href="../../img/{src}_small.png">png (small)</a>""",
+                f"""<a href="../../img/{src}_medium.png">png (medium)</a>""",
+                f"""<a href="../../img/{src}_large.png">png (large)</a>""",
+                f"""<a href="../../img/{src}_small.pdf">pdf (small)</a>""",
+                f"""<a href="../../img/{src}.pdf">pdf (medium/large)</a>""",
+                f"""<a href="../../img/{src}_small.svg">svg (small)</a>""",
+                f"""<a href="../../img/{src}.svg">svg (medium/large)</a>"""]) + """</div>""")
 
         # Remaining items
         for arg in args[1:]:
-            s += arg.html(display=True)
-            s += "\n\n"
-
-        # Generate TeX listing
-        for arg in self.args():
-            if arg.head() in (Formula, Assumptions):
-                for arg2 in arg.args():
-                    all_tex.append(arg2.latex())
+            parts.append(arg.html(display=True))
+            parts.append("\n\n")
 
         if all_tex:
-            s += """<div class="entrysubhead">TeX:</div>"""
-            s += "<pre>"
-            s += "\n\n".join(all_tex)
-            s += "</pre>"
+            parts.append("""<div class="entrysubhead">TeX:</div>""")
+            parts.append("<pre>")
+            parts.append("\n\n".join(all_tex))
+            parts.append("</pre>")
 
         # Generate symbol table
         symbols = self.all_symbols()
         symbols = [sym for sym in symbols if sym not in exclude_symbols]
-        s += """<div class="entrysubhead">Definitions:</div>"""
-        s += Expr.definitions_table_html(symbols, center=True, symbol_dir=symbol_dir)
+        parts.append("""<div class="entrysubhead">Definitions:</div>""")
+        parts.append(Expr.definitions_table_html(symbols, center=True, symbol_dir=symbol_dir))
 
-        s += """<div class="entrysubhead">Source code for this entry:</div>"""
-        s += "<pre>"
-        s += self.str()
-        s += "</pre>"
+        parts.append("""<div class="entrysubhead">Source code for this entry:</div>""")
+        parts.append("<pre>")
+        parts.append(self.str())
+        parts.append("</pre>")
 
-        s += "</div></div>\n"
+        parts.append("</div></div>\n")
 
-        return s
+        return "".join(parts)
 
     @staticmethod
     def definitions_table_html(symbols, center=False, entry_dir="../../entry/", symbol_dir="../../symbol/"):
         katex = katex_function[0]
-        s = ""
+        parts = []
         if center:
-            s += """<table style="margin: 0 auto">"""
+            parts.append("""<table style="margin: 0 auto">""")
         else:
-            s += """<table>"""
+            parts.append("""<table>""")
         # s += """<tr><th>Fungrim symbol</th> <th>Notation</th> <th>Domain</th> <th>Codomain</th> <th>Description</th></tr>"""
-        s += """<tr><th>Fungrim symbol</th> <th>Notation</th> <th>Short description</th></tr>"""
+        parts.append("""<tr><th>Fungrim symbol</th> <th>Notation</th> <th>Short description</th></tr>""")
         for symbol in symbols:
-            if symbol in descriptions:
-                example, domain, codomain, description = descriptions[symbol]
-                s += """<tr><td><tt><a href="%s%s/">%s</a></tt>""" % (symbol_dir, symbol.str(), symbol.str())
-                s += """<td>%s</td>""" % katex(example.latex(), False)
+            desc = descriptions.get(symbol)
+            if desc is not None:
+                example, domain, codomain, description = desc
+                name = symbol.str()
+                parts.append(f"""<tr><td><tt><a href="{symbol_dir}{name}/">{name}</a></tt>""")
+                parts.append(f"""<td>{katex(example.latex(), False)}</td>""")
                 # domstr = ",\, ".join(dom.latex() for dom in domain)
                 # s += """<td>%s</td>""" % katex(domstr, False)
                 # if codomain is None:
                 #     s += """<td></td>"""
                 # else:
                 #     s += """<td>%s</td>""" % katex(codomain.latex(), False)
-                s += """<td>%s</td></tr>""" % description
-        s += """</table>"""
-        return s
+                parts.append(f"""<td>{description}</td></tr>""")
+        parts.append("""</table>""")
+        return "".join(parts)
 
 all_builtins = []
 
@@ -1506,17 +923,1019 @@ symbol_latex_table = {
     BetaFunction: "\\mathrm{B}",
 }
 
-described_symbols = []
+# head sets used for membership tests when rendering LaTeX
+_add_sub_heads = frozenset([Add, Sub])
+_neg_sub_heads = frozenset([Neg, Sub])
+_exp_as_power_heads = frozenset([Pos, Neg, Add, Sub, Mul, Div, Pow, Abs, Sqrt])
+_exp_sqrt_heads = frozenset([Exp, Sqrt])
+_pow_prefix_heads = frozenset([Sin, Cos, Csc, Tan, Sinh, Cosh, Tanh, DedekindEta])
+_pow_delimited_heads = frozenset([Abs, Binomial, PrimeNumber, Matrix2x2, Parentheses, Braces, Brackets])
+_jacobi_theta_heads = frozenset([JacobiTheta1, JacobiTheta2, JacobiTheta3, JacobiTheta4])
+_min_max_heads = frozenset([Minimum, Maximum, Supremum, Infimum])
+_and_or_heads = frozenset([And, Or])
+_and_or_not_heads = frozenset([And, Or, Not])
+
+class _LazyArgStr(object):
+    """
+    Sequence of the LaTeX strings of a call's arguments, rendering each
+    argument only when a handler first asks for it.
+    """
+
+    __slots__ = ('_args', '_in_small', '_strs')
+
+    def __init__(self, args, in_small):
+        self._args = args
+        self._in_small = in_small
+        self._strs = [None] * len(args)
+
+    def __len__(self):
+        return len(self._args)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self._args)))]
+        s = self._strs[i]
+        if s is None:
+            s = self._strs[i] = _latex_cached(self._args[i], self._in_small)
+        return s
+
+    def __iter__(self):
+        for i in range(len(self._args)):
+            yield self[i]
+
+# LaTeX handlers for specific heads, dispatched via _latex_dispatch.
+# A handler returning None falls back to function call notation.
+
+def _latex_Exp(expr, args, argstr, in_small):
+    assert len(args) == 1
+    if args[0].show_exponential_as_power():
+        return Pow(ConstE, args[0]).latex(in_small=in_small)
+
+def _latex_Div(expr, args, argstr, in_small):
+    assert len(args) == 2
+    num, den = args
+    if in_small:
+        numstr = num.latex(in_small=True)
+        denstr = den.latex(in_small=True)
+        if num.need_parens_in_mul():  # fixme!
+            numstr = rf"\left( {numstr} \right)"
+        if den.need_parens_in_mul():  # fixme!
+            denstr = rf"\left( {denstr} \right)"
+        return numstr + " / " + denstr
+    else:
+        numstr = num.latex()
+        denstr = den.latex()
+        #if num.is_integer() and den.is_integer():
+        #    return "\\frac{" + numstr + "}{" + denstr + "}"
+        #else:
+        return "\\frac{" + numstr + "}{" + denstr + "}"
+
+def _latex_Where(expr, args, argstr, in_small):
+    return argstr[0] + "\; \\text{ where } " + ",\,".join(argstr[1:])
+
+def _latex_Pos(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "+" + argstr[0]
+
+def _latex_Neg(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "-" + argstr[0]
+
+def _latex_Add(expr, args, argstr, in_small):
+    return " + ".join(argstr)
+
+def _latex_Sub(expr, args, argstr, in_small):
+    parts = []
+    for i in range(len(args)):
+        if i > 0 and not args[i].is_atom() and args[i]._head in _neg_sub_heads:
+            parts.append(rf"\left({argstr[i]}\right)")
+        else:
+            parts.append(argstr[i])
+    return " - ".join(parts)
+
+def _latex_Mul(expr, args, argstr, in_small):
+    parts = []
+    for i in range(len(args)):
+        if args[i].need_parens_in_mul():
+            parts.append(rf"\left({argstr[i]}\right)")
+        else:
+            parts.append(argstr[i])
+    return " ".join(parts)
+
+def _latex_Pow(expr, args, argstr, in_small):
+    assert len(args) == 2
+    # remove frac to try to keep it on one line
+    base = args[0]
+    expo = args[1]
+    # todo: more systematic solutions
+    # atoms have no head, so bhead is None and none of the head tests match
+    bhead = base._head
+    if bhead in _pow_prefix_heads:
+        return bhead.latex() + "^{" + expo.latex(in_small=True) + "}" + "\\!\\left(" + base._val[0].latex(in_small=in_small) + "\\right)"
+    if bhead is Fibonacci:
+        return f"F_{{{base._val[0].latex(in_small=in_small)}}}^{{{expo.latex(in_small=True)}}}"
+    if bhead in _jacobi_theta_heads and len(base._val) == 2:
+        return bhead.latex() + rf"^{{{expo.latex(in_small=True)}}}\!\left({base._val[0].latex()}, {base._val[1].latex()}\right)"
+    h = subscript_call_latex_table.get(bhead)
+    if h is not None and len(base._val) == 2:
+        s = base._val[0].latex(in_small=True)
+        e = expo.latex(in_small=True)
+        v = base._val[1].latex(in_small=in_small)
+        return rf"{h}_{{{s}}}^{{{e}}}\!\left({v}\right)"
+    basestr = base.latex(in_small=in_small)
+    expostr = expo.latex(in_small=True)
+    if base.is_symbol() or (base.is_integer() and base._val >= 0) or bhead in _pow_delimited_heads:
+        return "{" + basestr + "}^{" + expostr + "}"
+    else:
+        return "{\\left(" + basestr + "\\right)}^{" + expostr + "}"
+
+def _latex_Integral(expr, args, argstr, in_small):
+    assert len(args) == 2
+    assert args[1]._head is Tuple
+    var, low, high = args[1]._val
+    var = var.latex()
+    low = low.latex(in_small=True)
+    high = high.latex(in_small=True)
+    return rf"\int_{{{low}}}^{{{high}}} {argstr[0]} \, d{var}"
+
+def _latex_IndefiniteIntegralEqual(expr, args, argstr, in_small):
+    # IndefiniteIntegralEqual(f(z), g(z), z, c)
+    if len(args) == 3:
+        fx, gx, x = args
+        fx = argstr[0]
+        gx = argstr[1]
+        x = argstr[2]
+        return rf"\int {fx} \, d{x} = {gx} + \mathcal{{C}}"
+    elif len(args) == 4:
+        fx, gx, x, c = args
+        fx = argstr[0]
+        gx = argstr[1]
+        x = argstr[2]
+        if x == c:
+            return rf"\int {fx} \, d{x} = {gx} + \mathcal{{C}}"
+        else:
+            return rf"\int {fx} \, d{x} = {gx} + \mathcal{{C}}, {x} = {c}"
+    else:
+        raise ValueError
+
+def _latex_Sum(expr, args, argstr, in_small):
+    head = expr._head
+    # Sum(f(n), Tuple(n, a, b))
+    # Sum(f(n), Tuple(n, a, b), P(n)) ???
+    # Sum(f(n), n, P(n))
+    if head is Sum:
+        ss = "\\sum"
+    else:
+        ss = "\\prod"
+    # todo: auto-parenthesis for Add/...?
+    if len(args) == 2 and not args[1].is_atom() and args[1]._head is Tuple:
+        var, low, high = args[1]._val
+        var = var.latex()
+        low = low.latex(in_small=True)
+        high = high.latex(in_small=True)
+        return ss + (f"_{{{var}={low}}}^{{{high}}} {argstr[0]}")
+    elif len(args) == 2:
+        func, var = args
+        return ss + (f"_{{{var}}} {argstr[0]}")
+    elif len(args) == 3:
+        func, var, cond = args
+        cond = cond.latex(in_small=True)
+        return ss + (f"_{{{cond}}} {argstr[0]}")
+    else:
+        raise ValueError
+
+def _latex_DivisorSum(expr, args, argstr, in_small):
+    head = expr._head
+    if len(args) == 3:
+        formula, var, number = args
+        formula = argstr[0]
+        var = var.latex()
+        number = number.latex(in_small=True)
+        ss = rf"_{{{var} \mid {number}}} {formula}"
+    elif len(args) == 4:
+        formula, var, number, cond = args
+        formula = argstr[0]
+        var = var.latex()
+        number = number.latex(in_small=True)
+        cond = cond.latex(in_small=True)
+        #ss = "_{\\begin{matrix} {\\scriptstyle %s \\mid %s} \\\\ {\\scriptstyle %s} \\end{matrix}} %s" % (var, number, cond, formula)
+        ss = rf"_{{{var} \mid {number},\, {cond}}} {formula}"
+    else:
+        raise ValueError
+    if head is DivisorSum:
+        return "\\sum" + ss
+    else:
+        return "\\prod" + ss
+
+def _latex_PrimeSum(expr, args, argstr, in_small):
+    head = expr._head
+    if len(args) == 2:
+        formula, var = args
+        formula = argstr[0]
+        var = var.latex()
+        ss = f"_{{{var}}} {formula}"
+    elif len(args) == 3:
+        formula, var, cond = args
+        formula = argstr[0]
+        var = var.latex()
+        cond = cond.latex(in_small=True)
+        ss = f"_{{{cond}}} {formula}"
+    else:
+        raise ValueError
+    if head is PrimeSum:
+        return "\\sum" + ss
+    else:
+        return "\\prod" + ss
+
+def _latex_Limit(expr, args, argstr, in_small):
+    head = expr._head
+    if len(args) == 3:
+        formula, var, point = args
+        cond = ""
+    elif len(args) == 4:
+        formula, var, point, cond = args
+        cond = ", " + cond.latex(in_small=True)
+    else:
+        raise ValueError
+    var = var.latex()
+    point = point.latex(in_small=True)
+    formula = formula.latex()
+    if (not args[2].is_atom() and args[2].head() is not Abs):
+        formula = rf"\left[ {formula} \right]"
+    if head is LeftLimit:
+        s = rf"\lim_{{{var} \to {{{point}}}^{{-}}{cond}}} {formula}"
+    elif head is RightLimit:
+        s = rf"\lim_{{{var} \to {{{point}}}^{{+}}{cond}}} {formula}"
+    else:
+        s = rf"\lim_{{{var} \to {point}{cond}}} {formula}"
+    return s
+
+def _latex_Minimum(expr, args, argstr, in_small):
+    head = expr._head
+    opname = {Minimum:"\\min", Maximum:"\\max",
+              ArgMin:"\\operatorname{arg\,min}",ArgMinUnique:"\\operatorname{arg\,min*}",
+              ArgMax:"\\operatorname{arg\,max}",ArgMaxUnique:"\\operatorname{arg\,max*}",
+              Infimum:"\\operatorname{inf}", Supremum:"\\operatorname{sup}",
+              Zeros:"\\operatorname{zeros}\\,", UniqueZero:"\\operatorname{zero*}\\,",
+              Solutions:"\\operatorname{solutions}\\,", UniqueSolution:"\\operatorname{solution*}\\,"}[head]
+    if head in _min_max_heads and len(args) == 1:
+        return rf"{opname}\left({argstr[0]}\right)"
+    assert len(args) == 3
+    formula, var, predicate = args
+    #var = var.latex()
+    if 0 and predicate.head() is And and len(predicate.args()) > 1:
+        # katex does not support substack
+        predicate = "\\begin{matrix}" + "\\\\".join(rf"\scriptstyle {s.latex(in_small=True)} " for s in predicate.args()) + "\\end{matrix}"
+    else:
+        predicate = predicate.latex(in_small=True)
+    if formula.head() in _add_sub_heads:
+        formula = "\\left(" + formula.latex() + "\\right)"
+    else:
+        formula = formula.latex()
+    return rf"\mathop{{{opname}}}\limits_{{{predicate}}} {formula}"
+
+def _latex_ComplexZeroMultiplicity(expr, args, argstr, in_small):
+    assert len(args) == 3
+    f, var, point = argstr
+    if args[1] == args[2]:
+        return rf"\mathop{{\operatorname{{ord}}}}\limits_{{{point}}} {f}"
+    else:
+        return rf"\mathop{{\operatorname{{ord}}}}\limits_{{{var}={point}}} {f}"
+
+def _latex_Residue(expr, args, argstr, in_small):
+    assert len(args) == 3
+    f, var, point = argstr
+    if args[1] == args[2]:
+        return rf"\mathop{{\operatorname{{Res}}}}\limits_{{{point}}} {f}"
+    else:
+        return rf"\mathop{{\operatorname{{Res}}}}\limits_{{{var}={point}}} {f}"
+
+def _latex_Derivative(expr, args, argstr, in_small):
+    if len(args) == 2:
+        assert args[1]._head is Tuple
+        var, point, order = args[1]._val
+    elif len(args) == 3:
+        _, var, point = args
+        order = Expr(1)
+    elif len(args) == 4:
+        _, var, point, order = args
+    if not args[0].is_atom():
+        f = args[0].head()
+        if f.is_symbol() and f not in _exp_sqrt_heads and args[0].args() == (var,):
+            pointstr = point.latex(in_small=True)
+            fstr = args[0].head().latex()
+            if order.is_integer() and order._val == 0:
+                return f"{fstr}({pointstr})"
+            if order.is_integer() and order._val == 1:
+                return f"{fstr}'({pointstr})"
+            if order.is_integer() and order._val == 2:
+                return f"{fstr}''({pointstr})"
+            if order.is_integer() and order._val == 3:
+                return f"{fstr}'''({pointstr})"
+            return f"{{{fstr}}}^{{({order.latex()})}}({pointstr})"
+        fstr = subscript_call_latex_table.get(f)
+        if fstr is not None and len(args[0].args()) == 2 and args[0].args()[1] == var:
+            arg0 = args[0].args()[0].latex(in_small=True)
+            pointstr = point.latex(in_small=True)
+            if order.is_integer() and order._val == 0:
+                return f"{fstr}_{{{arg0}}}({pointstr})"
+            if order.is_integer() and order._val == 1:
+                return f"{fstr}'_{{{arg0}}}({pointstr})"
+            if order.is_integer() and order._val == 2:
+                return f"{fstr}''_{{{arg0}}}({pointstr})"
+            if order.is_integer() and order._val == 3:
+                return f"{fstr}'''_{{{arg0}}}({pointstr})"
+            return f"{{{fstr}}}^{{({order.latex()})}}_{{{arg0}}}({pointstr})"
+    varstr = var.latex()
+    pointstr = point.latex(in_small=True)
+    orderstr = order.latex()
+    if var is point:
+        if order.is_integer() and order._val == 1:
+            return rf"\frac{{d}}{{d {varstr}}}\, {argstr[0]}"
+        else:
+            return rf"\frac{{d^{{{orderstr}}}}}{{{{d {varstr}}}^{{{orderstr}}}}} {argstr[0]}"
+    else:
+        if order.is_integer() and order._val == 1:
+            return rf"\left[ \frac{{d}}{{d {varstr}}}\, {argstr[0]} \right]_{{{varstr} = {pointstr}}}"
+        else:
+            return rf"\left[ \frac{{d^{{{orderstr}}}}}{{{{d {varstr}}}^{{{orderstr}}}}} {argstr[0]} \right]_{{{varstr} = {pointstr}}}"
+
+def _latex_Sqrt(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "\\sqrt{" + argstr[0] + "}"
+
+def _latex_Abs(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "\\left|" + argstr[0] + "\\right|"
+
+def _latex_Floor(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "\\left\\lfloor " + argstr[0] + " \\right\\rfloor"
+
+def _latex_Ceil(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "\\left\\lceil " + argstr[0] + " \\right\\rceil"
+
+def _latex_Tuple(expr, args, argstr, in_small):
+    return "\\left(" + ", ".join(argstr) + "\\right)"
+
+def _latex_Set(expr, args, argstr, in_small):
+    return "\\left\{" + ", ".join(argstr) + "\\right\}"
+
+def _latex_List(expr, args, argstr, in_small):
+    return "\\left[" + ", ".join(argstr) + "\\right]"
+
+# todo: unify subscript cases
+def _latex_BernoulliB(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "B_{" + argstr[0] + "}"
+
+def _latex_Fibonacci(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "F_{" + args[0].latex(in_small=True) + "}"
+
+def _latex_BellNumber(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "B_{" + argstr[0] + "}"
+
+def _latex_HarmonicNumber(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "H_{" + argstr[0] + "}"
+
+def _latex_PrimeNumber(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "p_{" + argstr[0] + "}"
+
+def _latex_RiemannZetaZero(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "\\rho_{" + argstr[0] + "}"
+
+def _latex_DirichletLZero(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"\rho_{{{argstr[0]}, {argstr[1]}}}"
+
+def _latex_LegendrePolynomialZero(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return f"x_{{{argstr[0]},{argstr[1]}}}"
+
+def _latex_GaussLegendreWeight(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return f"w_{{{argstr[0]},{argstr[1]}}}"
+
+def _latex_GeneralizedBernoulliB(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return f"B_{{{argstr[0]},{argstr[1]}}}"
+
+def _latex_BesselJ(expr, args, argstr, in_small):
+    head = expr._head
+    assert len(args) == 2
+    n, z = args
+    nstr = n.latex(in_small=True)
+    zstr = z.latex(in_small)
+    fsym = {BesselJ:"J", BesselI:"I", BesselY:"Y", BesselK:"K", HankelH1:"H^{(1)}", HankelH2:"H^{(2)}"}[head]
+    return fsym + "_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
+
+def _latex_BesselJDerivative(expr, args, argstr, in_small):
+    head = expr._head
+    assert len(args) == 3
+    n, z, r = args
+    nstr = n.latex(in_small=True)
+    zstr = z.latex(in_small)
+    rstr = r.latex(in_small)
+    fsym = {BesselJDerivative:"J", BesselIDerivative:"I", BesselYDerivative:"Y", BesselKDerivative:"K", HankelH1:"H^{(1)}", HankelH2:"H^{(2)}"}[head]
+    if r.is_integer() and r._val >= 0 and r._val <= 3:
+        return fsym + ("'" * r._val) + "_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
+    else:
+        return fsym + "^{(" + rstr + ")}_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
+
+def _latex_CoulombF(expr, args, argstr, in_small):
+    head = expr._head
+    assert len(args) == 3
+    l, eta, z = args
+    lstr = l.latex(in_small=True)
+    etastr = eta.latex(in_small=True)
+    zstr = z.latex()
+    F = {CoulombF:"F", CoulombG:"G"}[head]
+    return F + (rf"_{{{lstr},{etastr}}}\!\left(") + zstr + "\\right)"
+
+def _latex_CoulombH(expr, args, argstr, in_small):
+    assert len(args) == 4
+    omega, l, eta, z = args
+    if omega.is_integer():
+        omegastr = "+"
+        if omega._val == -1:
+            omegastr = "-"
+    else:
+        omegastr = omega.latex(in_small=True)
+    lstr = l.latex(in_small=True)
+    etastr = eta.latex(in_small=True)
+    zstr = z.latex()
+    return "H" + (rf"^{{{omegastr}}}_{{{lstr},{etastr}}}\!\left(") + zstr + "\\right)"
+
+def _latex_CoulombC(expr, args, argstr, in_small):
+    l, eta = args
+    lstr = l.latex(in_small=True)
+    etastr = eta.latex()
+    return rf"C_{{{lstr}}}\!\left({etastr}\right)"
+
+def _latex_CoulombSigma(expr, args, argstr, in_small):
+    l, eta = args
+    lstr = l.latex(in_small=True)
+    etastr = eta.latex()
+    return rf"\sigma_{{{lstr}}}\!\left({etastr}\right)"
+
+def _latex_Factorial(expr, args, argstr, in_small):
+    head = expr._head
+    assert len(args) == 1
+    ss = "!"
+    if head is DoubleFactorial:
+        ss += "!"
+    if args[0].is_symbol() or (args[0].is_integer() and args[0]._val >= 0):
+        return argstr[0] + " " + ss
+    else:
+        return "\\left(" + argstr[0] + "\\right)" + ss
+
+def _latex_RisingFactorial(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return "\\left(" + argstr[0] + "\\right)_{" + argstr[1] + "}"
+
+def _latex_FallingFactorial(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return "\\left(" + argstr[0] + "\\right)^{\\underline{" + argstr[1] + "}}"
+
+def _latex_Binomial(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return "{" + argstr[0] + " \\choose " + argstr[1] + "}"
+
+def _latex_StirlingCycle(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"\left[{{{argstr[0]} \atop {argstr[1]}}}\right]"
+
+def _latex_StirlingS1(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"s\!\left({argstr[0]}, {argstr[1]}\right)"
+
+def _latex_StirlingS2(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"\left\{{{{{argstr[0]} \atop {argstr[1]}}}\right\}}"
+
+def _latex_LambertW(expr, args, argstr, in_small):
+    assert len(args) in (2,3)
+    if len(args) == 2:
+        n, z = args
+        nstr = n.latex(in_small=True)
+        zstr = z.latex(in_small)
+        return "W_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
+    else:
+        n, z, r = args
+        nstr = n.latex(in_small=True)
+        zstr = z.latex(in_small)
+        rstr = r.latex(in_small)
+        if r.is_integer() and r._val >= 0 and r._val <= 3:
+            return "W" + ("'" * r._val) + "_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
+        else:
+            return "W" + "^{(" + rstr + ")}_{" + nstr + "}" + "\!\\left(" + zstr + "\\right)"
+
+def _latex_LambertWPuiseuxCoefficient(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "{\\mu}_{" + argstr[0] + "}"
+
+def _latex_AsymptoticTo(expr, args, argstr, in_small):
+    assert len(argstr) == 4
+    return rf"{argstr[0]} \sim {argstr[1]}, \; {argstr[2]} \to {argstr[3]}"
+
+def _latex_And(expr, args, argstr, in_small):
+    parts = []
+    for i in range(len(args)):
+        if (not args[i].is_atom()) and args[i].head() in _and_or_heads:
+            parts.append(rf"\left({argstr[i]}\right)")
+        else:
+            parts.append(argstr[i])
+    if in_small:
+        # see ff190c
+        #return "\\text{ and }".join(parts)
+        return ",\\,".join(parts)
+    else:
+        return " \\,\\mathbin{\\operatorname{and}}\\, ".join(parts)
+        #return " \\,\\land\\, ".join(parts)
+
+def _latex_Or(expr, args, argstr, in_small):
+    parts = []
+    for i in range(len(args)):
+        if (not args[i].is_atom()) and args[i].head() in _and_or_not_heads:
+            parts.append(rf"\left({argstr[i]}\right)")
+        else:
+            parts.append(argstr[i])
+    return " \\,\\mathbin{\\operatorname{or}}\\, ".join(parts)
+    #return " \\,\\lor\\, ".join(parts)
+
+def _latex_Not(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return rf" \operatorname{{not}} \left({argstr[0]}\right)"
+    #return " \\neg \\left(%s\\right)" % argstr[0]
+
+def _latex_Implies(expr, args, argstr, in_small):
+    return " \\implies ".join(rf"\left({s}\right)" for s in argstr)
+
+def _latex_Equivalent(expr, args, argstr, in_small):
+    return " \\iff ".join(rf"\left({s}\right)" for s in argstr)
+
+def _latex_EqualAndElement(expr, args, argstr, in_small):
+    assert len(args) == 3
+    return rf"{argstr[0]} = {argstr[1]} \in {argstr[2]}"
+
+def _latex_KroneckerDelta(expr, args, argstr, in_small):
+    assert len(args) == 2
+    xstr = args[0].latex(in_small=True)
+    ystr = args[1].latex(in_small=True)
+    return rf"\delta_{{({xstr},{ystr})}}"
+
+def _latex_LegendreSymbol(expr, args, argstr, in_small):
+    if 0 and in_small:
+        return rf"({argstr[0]} \mid {argstr[1]})"
+    else:
+        return rf"\left( \frac{{{argstr[0]}}}{{{argstr[1]}}} \right)"
+
+def _latex_CongruentMod(expr, args, argstr, in_small):
+    return rf"{argstr[0]} \equiv {argstr[1]} \pmod {{{argstr[2]}}}"
+
+def _latex_Odd(expr, args, argstr, in_small):
+    return rf"{argstr[0]} \text{{ odd}}"
+
+def _latex_Even(expr, args, argstr, in_small):
+    return rf"{argstr[0]} \text{{ even}}"
+
+def _latex_ZZGreaterEqual(expr, args, argstr, in_small):
+    assert len(args) == 1
+    # if args[0].is_integer():
+    #    return "\{%s, %s, \ldots\}" % (args[0]._val, args[0]._val + 1)
+    return rf"\mathbb{{Z}}_{{\ge {argstr[0]}}}"
+
+def _latex_ZZLessEqual(expr, args, argstr, in_small):
+    assert len(args) == 1
+    if args[0].is_integer():
+        return rf"\{{{args[0]._val}, {args[0]._val - 1}, \ldots\}}"
+    return rf"\mathbb{{Z}}_{{\le {argstr[0]}}}"
+
+def _latex_ZZBetween(expr, args, argstr, in_small):
+    assert len(args) == 2
+    if args[0].is_integer():
+        return rf"\{{{argstr[0]}, {args[0]._val + 1}, \ldots {argstr[1]}\}}"
+    else:
+        return rf"\{{{argstr[0]}, {argstr[0]} + 1, \ldots {argstr[1]}\}}"
+
+def _latex_ClosedInterval(expr, args, argstr, in_small):
+    head = expr._head
+    assert len(args) == 2
+    #arg0 = args[0].latex(in_small=True)
+    #arg1 = args[1].latex(in_small=True)
+    arg0 = args[0].latex(in_small=in_small)
+    arg1 = args[1].latex(in_small=in_small)
+    if head is ClosedInterval:
+        return rf"\left[{arg0}, {arg1}\right]"
+    if head is OpenInterval:
+        return rf"\left({arg0}, {arg1}\right)"
+    if head is ClosedOpenInterval:
+        return rf"\left[{arg0}, {arg1}\right)"
+    if head is OpenClosedInterval:
+        return rf"\left({arg0}, {arg1}\right]"
+
+def _latex_RealBall(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"\left[{args[0].latex(in_small=True)} \pm {args[1].latex(in_small=True)}\right]"
+
+def _latex_BernsteinEllipse(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "\\mathcal{E}_{" + argstr[0] + "}"
+
+def _latex_Lattice(expr, args, argstr, in_small):
+    return "\\Lambda_{(" + ", ".join(argstr) + ")}"
+
+def _latex_DomainCodomain(expr, args, argstr, in_small):
+    assert len(args) == 2
+    #return "%s \\rightarrow %s" % (argstr[0], argstr[1])
+
+def _latex_Conjugate(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return rf"\overline{{{argstr[0]}}}"
+
+def _latex_SetBuilder(expr, args, argstr, in_small):
+    assert len(args) == 3
+    return rf"\left\{{ {argstr[0]} : {argstr[2]} \right\}}"
+
+def _latex_Cardinality(expr, args, argstr, in_small):
+    assert len(args) == 1
+    #return "\\text{card }" + argstr[0]
+    return "\\# " + argstr[0]
+    #return "\\left|" + argstr[0] + "\\right|"
+
+def _latex_Decimal(expr, args, argstr, in_small):
+    assert len(args) == 1
+    mant, expo = _decimal_parts(args[0]._val)
+    if expo is None:
+        return mant
+    return mant + " \\cdot 10^{" + expo + "}"
+
+def _latex_Matrix2x2(expr, args, argstr, in_small):
+    assert len(args) == 4
+    return rf"\begin{{pmatrix}} {argstr[0]} & {argstr[1]} \\ {argstr[2]} & {argstr[3]} \end{{pmatrix}}"
+
+def _latex_Matrix2x1(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"\begin{{pmatrix}} {argstr[0]} \\ {argstr[1]} \end{{pmatrix}}"
+
+def _latex_ModularGroupAction(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"{argstr[0]} \circ {argstr[1]}"
+
+def _latex_PrimitiveReducedPositiveIntegralBinaryQuadraticForms(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return rf"\mathcal{{Q}}^{{*}}_{{{argstr[0]}}}"
+
+def _latex_HypergeometricUStarRemainder(expr, args, argstr, in_small):
+    assert len(args) == 4
+    return rf"R_{{{argstr[0]}}}\!\left({argstr[1]},{argstr[2]},{argstr[3]}\right)"
+
+def _latex_DirichletCharacter(expr, args, argstr, in_small):
+    if len(args) == 2:
+        return rf"\chi_{{{argstr[0]}}}({argstr[1]}, \cdot)"
+    elif len(args) == 3:
+        return rf"\chi_{{{argstr[0]}}}({argstr[1]}, {argstr[2]})"
+    else:
+        raise ValueError
+
+def _latex_DirichletGroup(expr, args, argstr, in_small):
+    #return "\\{\\chi_{%s}\\}" % argstr[0]
+    return f"G_{{{argstr[0]}}}"
+
+def _latex_PrimitiveDirichletCharacters(expr, args, argstr, in_small):
+    return rf"G_{{{argstr[0]}}}^{{\text{{primitive}}}}"
+
+def _latex_GaussSum(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return "G_{" + argstr[0] + "}" + "\!\\left(" + argstr[1] + "\\right)"
+
+def _latex_StieltjesGamma(expr, args, argstr, in_small):
+    arg0 = args[0].latex(in_small=True)
+    if len(args) == 1:
+        return rf"\gamma_{{{arg0}}}"
+    if len(args) == 2:
+        return rf"\gamma_{{{arg0}}}\!\left({argstr[1]}\right)"
+
+def _latex_StirlingSeriesRemainder(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"R_{{{argstr[0]}}}\!\left({argstr[1]}\right)"
+
+def _latex_FormalPowerSeries(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return f"{argstr[0]}[[{argstr[1]}]]"
+
+def _latex_FormalLaurentSeries(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"{argstr[0]}(\!({argstr[1]})\!)"
+
+def _latex_SeriesCoefficient(expr, args, argstr, in_small):
+    assert len(args) == 3
+    return f"[{{{argstr[1]}}}^{{{argstr[2]}}}] {argstr[0]}"
+
+def _latex_FormalGenerator(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"{argstr[0]} \text{{ is the generator of }} {argstr[1]}"
+
+def _latex_Parentheses(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "\\left(" + args[0].latex() + "\\right)"
+
+def _latex_Brackets(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "\\left[" + args[0].latex() + "\\right]"
+
+def _latex_Braces(expr, args, argstr, in_small):
+    assert len(args) == 1
+    return "\\left\\{" + args[0].latex() + "\\right\\}"
+
+def _latex_Call(expr, args, argstr, in_small):
+    return argstr[0] + "\!\\left(" + ", ".join(argstr[1:]) + "\\right)"
+
+def _latex_Subscript(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return "{" + argstr[0] + "}_{" + args[1].latex(in_small=True) + "}"
+
+def _latex_Spectrum(expr, args, argstr, in_small):
+    if args[0].head() is Matrix2x2:
+        assert len(args) == 1
+        return "\\operatorname{spec}" + argstr[0]
+
+def _latex_Det(expr, args, argstr, in_small):
+    if args[0].head() is Matrix2x2:
+        assert len(args) == 1
+        return "\\operatorname{det}" + argstr[0]
+
+def _latex_ForAll(expr, args, argstr, in_small):
+    assert len(args) == 3
+    return rf"\text{{for all }} {argstr[0]}: {argstr[1]}, {argstr[2]}"
+
+def _latex_Exists(expr, args, argstr, in_small):
+    assert len(args) == 2
+    return rf"\text{{there exists }} {argstr[0]}: {argstr[1]}"
+
+def _latex_Cases(expr, args, argstr, in_small):
+    rows = []
+    for arg in args:
+        assert arg._head is Tuple
+        v, c = arg._val
+        #v = v.latex(in_small=True)
+        v = v.latex(in_small=in_small)
+        if c is Otherwise:
+            c = "\\text{otherwise}"
+        else:
+            #c = c.latex(in_small=True)
+            c = c.latex(in_small=in_small)
+        rows.append(rf"{v}, & {c}\\")
+    return "\\begin{cases} " + "".join(rows) + " \\end{cases}"
+
+def _latex_DiscreteLog(expr, args, argstr, in_small):
+    n, b, p = args
+    n, b, p = argstr[0], b.latex(in_small=True), argstr[2]
+    return rf"\log_{{{b}}}\!\left({n}\right) \bmod {p}"
+
+def _latex_ConreyGenerator(expr, args, argstr, in_small):
+    return f"g_{{{argstr[0]}}}"
+
+def _latex_QSeriesCoefficient(expr, args, argstr, in_small):
+    fun, tau, q, n, qdef = argstr
+    return rf"[{q}^{{{n}}}] {fun} \; \left({qdef}\right)"
+
+def _latex_EqualQSeriesEllipsis(expr, args, argstr, in_small):
+    fun, tau, q, ser, qdef = argstr
+    return rf"{fun} = {ser} + \ldots \; \text{{ where }} {qdef}"
+
+def _latex_Description(expr, args, argstr, in_small):
+    parts = []
+    for arg in args:
+        if arg._tag == 2:
+            parts.append(rf"\text{{ {arg._val} }}")
+        else:
+            parts.append(arg.latex())
+    return "".join(parts)
+
+_latex_dispatch = {
+    Exp: _latex_Exp,
+    Div: _latex_Div,
+    Where: _latex_Where,
+    Pos: _latex_Pos,
+    Neg: _latex_Neg,
+    Add: _latex_Add,
+    Sub: _latex_Sub,
+    Mul: _latex_Mul,
+    Pow: _latex_Pow,
+    Integral: _latex_Integral,
+    IndefiniteIntegralEqual: _latex_IndefiniteIntegralEqual,
+    RealIndefiniteIntegralEqual: _latex_IndefiniteIntegralEqual,
+    ComplexIndefiniteIntegralEqual: _latex_IndefiniteIntegralEqual,
+    Sum: _latex_Sum,
+    Product: _latex_Sum,
+    DivisorSum: _latex_DivisorSum,
+    DivisorProduct: _latex_DivisorSum,
+    PrimeSum: _latex_PrimeSum,
+    PrimeProduct: _latex_PrimeSum,
+    Limit: _latex_Limit,
+    SequenceLimit: _latex_Limit,
+    RealLimit: _latex_Limit,
+    LeftLimit: _latex_Limit,
+    RightLimit: _latex_Limit,
+    ComplexLimit: _latex_Limit,
+    MeromorphicLimit: _latex_Limit,
+    Minimum: _latex_Minimum,
+    Maximum: _latex_Minimum,
+    ArgMin: _latex_Minimum,
+    ArgMax: _latex_Minimum,
+    ArgMinUnique: _latex_Minimum,
+    ArgMaxUnique: _latex_Minimum,
+    Supremum: _latex_Minimum,
+    Infimum: _latex_Minimum,
+    Zeros: _latex_Minimum,
+    UniqueZero: _latex_Minimum,
+    Solutions: _latex_Minimum,
+    UniqueSolution: _latex_Minimum,
+    ComplexZeroMultiplicity: _latex_ComplexZeroMultiplicity,
+    Residue: _latex_Residue,
+    Derivative: _latex_Derivative,
+    RealDerivative: _latex_Derivative,
+    ComplexDerivative: _latex_Derivative,
+    ComplexBranchDerivative: _latex_Derivative,
+    MeromorphicDerivative: _latex_Derivative,
+    Sqrt: _latex_Sqrt,
+    Abs: _latex_Abs,
+    Floor: _latex_Floor,
+    Ceil: _latex_Ceil,
+    Tuple: _latex_Tuple,
+    Set: _latex_Set,
+    List: _latex_List,
+    BernoulliB: _latex_BernoulliB,
+    Fibonacci: _latex_Fibonacci,
+    BellNumber: _latex_BellNumber,
+    HarmonicNumber: _latex_HarmonicNumber,
+    PrimeNumber: _latex_PrimeNumber,
+    RiemannZetaZero: _latex_RiemannZetaZero,
+    DirichletLZero: _latex_DirichletLZero,
+    LegendrePolynomialZero: _latex_LegendrePolynomialZero,
+    GaussLegendreWeight: _latex_GaussLegendreWeight,
+    GeneralizedBernoulliB: _latex_GeneralizedBernoulliB,
+    BesselJ: _latex_BesselJ,
+    BesselY: _latex_BesselJ,
+    BesselI: _latex_BesselJ,
+    BesselK: _latex_BesselJ,
+    HankelH1: _latex_BesselJ,
+    HankelH2: _latex_BesselJ,
+    BesselJDerivative: _latex_BesselJDerivative,
+    BesselYDerivative: _latex_BesselJDerivative,
+    BesselIDerivative: _latex_BesselJDerivative,
+    BesselKDerivative: _latex_BesselJDerivative,
+    CoulombF: _latex_CoulombF,
+    CoulombG: _latex_CoulombF,
+    CoulombH: _latex_CoulombH,
+    CoulombC: _latex_CoulombC,
+    CoulombSigma: _latex_CoulombSigma,
+    Factorial: _latex_Factorial,
+    DoubleFactorial: _latex_Factorial,
+    RisingFactorial: _latex_RisingFactorial,
+    FallingFactorial: _latex_FallingFactorial,
+    Binomial: _latex_Binomial,
+    StirlingCycle: _latex_StirlingCycle,
+    StirlingS1: _latex_StirlingS1,
+    StirlingS2: _latex_StirlingS2,
+    LambertW: _latex_LambertW,
+    LambertWPuiseuxCoefficient: _latex_LambertWPuiseuxCoefficient,
+    AsymptoticTo: _latex_AsymptoticTo,
+    And: _latex_And,
+    Or: _latex_Or,
+    Not: _latex_Not,
+    Implies: _latex_Implies,
+    Equivalent: _latex_Equivalent,
+    EqualAndElement: _latex_EqualAndElement,
+    KroneckerDelta: _latex_KroneckerDelta,
+    LegendreSymbol: _latex_LegendreSymbol,
+    JacobiSymbol: _latex_LegendreSymbol,
+    KroneckerSymbol: _latex_LegendreSymbol,
+    CongruentMod: _latex_CongruentMod,
+    Odd: _latex_Odd,
+    Even: _latex_Even,
+    ZZGreaterEqual: _latex_ZZGreaterEqual,
+    ZZLessEqual: _latex_ZZLessEqual,
+    ZZBetween: _latex_ZZBetween,
+    ClosedInterval: _latex_ClosedInterval,
+    OpenInterval: _latex_ClosedInterval,
+    ClosedOpenInterval: _latex_ClosedInterval,
+    OpenClosedInterval: _latex_ClosedInterval,
+    RealBall: _latex_RealBall,
+    BernsteinEllipse: _latex_BernsteinEllipse,
+    Lattice: _latex_Lattice,
+    DomainCodomain: _latex_DomainCodomain,
+    Conjugate: _latex_Conjugate,
+    SetBuilder: _latex_SetBuilder,
+    Cardinality: _latex_Cardinality,
+    Decimal: _latex_Decimal,
+    Matrix2x2: _latex_Matrix2x2,
+    Matrix2x1: _latex_Matrix2x1,
+    ModularGroupAction: _latex_ModularGroupAction,
+    PrimitiveReducedPositiveIntegralBinaryQuadraticForms: _latex_PrimitiveReducedPositiveIntegralBinaryQuadraticForms,
+    HypergeometricUStarRemainder: _latex_HypergeometricUStarRemainder,
+    DirichletCharacter: _latex_DirichletCharacter,
+    DirichletGroup: _latex_DirichletGroup,
+    PrimitiveDirichletCharacters: _latex_PrimitiveDirichletCharacters,
+    GaussSum: _latex_GaussSum,
+    StieltjesGamma: _latex_StieltjesGamma,
+    StirlingSeriesRemainder: _latex_StirlingSeriesRemainder,
+    FormalPowerSeries: _latex_FormalPowerSeries,
+    FormalLaurentSeries: _latex_FormalLaurentSeries,
+    SeriesCoefficient: _latex_SeriesCoefficient,
+    FormalGenerator: _latex_FormalGenerator,
+    Parentheses: _latex_Parentheses,
+    Brackets: _latex_Brackets,
+    Braces: _latex_Braces,
+    Call: _latex_Call,
+    Subscript: _latex_Subscript,
+    Spectrum: _latex_Spectrum,
+    Det: _latex_Det,
+    ForAll: _latex_ForAll,
+    Exists: _latex_Exists,
+    Cases: _latex_Cases,
+    DiscreteLog: _latex_DiscreteLog,
+    ConreyGenerator: _latex_ConreyGenerator,
+    QSeriesCoefficient: _latex_QSeriesCoefficient,
+    EqualQSeriesEllipsis: _latex_EqualQSeriesEllipsis,
+    Description: _latex_Description,
+}
+
+# Renders expr as LaTeX without caching (Expr.latex memoizes this).
+# The tables are bound as keyword defaults so they are local lookups.
+def _latex(expr, in_small, *, _symbols=symbol_latex_table, _variables=variable_names,
+        _infix=infix_latex_table, _subscript=subscript_call_latex_table,
+        _dispatch=_latex_dispatch, _escape=_latex_text_escape, _render=_latex_cached):
+    tex = _symbols.get(expr)
+    if tex is not None:
+        return tex
+
+    if expr._tag != 3:
+        if expr._tag == 0:
+            if expr._val in _variables:
+                if len(expr._val) == 1:
+                    return expr._val
+                else:
+                    if expr._val == "epsilon":
+                        return "\\varepsilon"
+                    return "\\" + expr._val
+            return "\\operatorname{" + expr._val + "}"
+        if expr._tag == 1:
+            return str(expr._val)
+        if expr._tag == 2:
+            return "\\text{``" + expr._val.translate(_escape) + "''}"
+        raise NotImplementedError
+
+    head = expr._head
+    args = expr._val
+
+    tex = _infix.get(head)
+    if tex is not None:
+        argstr = [_render(arg, in_small) for arg in args]
+        return (" " + tex + " ").join(argstr)
+
+    # F(n,x,...) -> F_n(x,...)
+    tex = _subscript.get(head)
+    if tex is not None:
+        arg0 = _render(args[0], True)
+        args1 = ", ".join(_render(arg, in_small) for arg in args[1:])
+        return tex + "_{" + arg0 + "}" + "\!\\left(" + args1 + "\\right)"
+
+    argstr = _LazyArgStr(args, in_small)
+    handler = _dispatch.get(head)
+    if handler is not None:
+        s = handler(expr, args, argstr, in_small)
+        if s is not None:
+            return s
+
+    fstr = _render(expr._head, False)
+    if in_small:
+        spacer = ""
+    else:
+        spacer = "\\!"
+    s = fstr + spacer + "\\left(" + ", ".join(argstr) + "\\right)"
+    return s
+
+# described symbols in order of first description; a dict used as an
+# ordered set so that describing a symbol twice lists it once
+described_symbols = {}
 descriptions = {}
 long_descriptions = {}
 domain_tables = {}
 
 def describe(symbol, example, domain, codomain, description):
-    described_symbols.append(symbol)
+    described_symbols[symbol] = None
     descriptions[symbol] = (example, domain, codomain, description)
 
 def describe2(symbol, example, description, domain_table=None, long_description=None):
-    described_symbols.append(symbol)
+    described_symbols[symbol] = None
     descriptions[symbol] = (example, None, None, description)
     if long_description is not None:
         long_descriptions[symbol] = long_description
@@ -1554,8 +1973,8 @@ def make_entry(*args):
     if symd is not None:
         id = entry.get_arg_with_head(ID)
         symbol, example, description = symd.args()
-        described_symbols.append(symbol)
-        descriptions[symbol] = (example, None, None, description._text)
-        domain_tables[symbol] = id.args()[0]._text
+        described_symbols[symbol] = None
+        descriptions[symbol] = (example, None, None, description._val)
+        domain_tables[symbol] = id.args()[0]._val
     all_entries.append(entry)
 
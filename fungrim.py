@@ -28,12 +28,13 @@ entries_referencing_symbol = {}
 all_used_symbols = set()
 
 for entry in all_entries:
+    entry_id = entry.id()
     for symbol in entry.all_symbols():
         all_used_symbols.add(symbol)
         if symbol in entries_referencing_symbol:
-            entries_referencing_symbol[symbol].add(entry.id())
+            entries_referencing_symbol[symbol].add(entry_id)
         else:
-            entries_referencing_symbol[symbol] = set([entry.id()])
+            entries_referencing_symbol[symbol] = set([entry_id])
 
 topics_referencing_symbol = {}
 
@@ -42,11 +43,11 @@ for topic in all_topics:
     for arg in topic.args():
         if arg.head() is Entries:
             for id in arg.args():
-                entry = entries_dict[id._text]
-                if id._text in topics_referencing_entry:
-                    topics_referencing_entry[id._text].append(title)
+                entry = entries_dict[id._val]
+                if id._val in topics_referencing_entry:
+                    topics_referencing_entry[id._val].append(title)
                 else:
-                    topics_referencing_entry[id._text] = [title]
+                    topics_referencing_entry[id._val] = [title]
                 for symbol in entry.all_symbols():
                     if symbol not in topics_referencing_symbol:
                         topics_referencing_symbol[symbol] = {title:0}
@@ -87,12 +88,14 @@ except (IOError, ValueError):
     print("Unable to read katex_cache")
 
 def katex(string, display=True):
-    if (string, display) in katex_cache:
-        return katex_cache[(string, display)]
+    key = (string, display)
+    s = katex_cache.get(key)
+    if s is not None:
+        return s
     s = subprocess.check_output(["node", "katex.js",
                                  {True:"display",False:"inline"}[display], string],
                                 universal_newlines=True)
-    katex_cache[(string, display)] = s
+    katex_cache[key] = s
     return s
 
 katex_function.append(katex)
@@ -322,7 +325,7 @@ class TopicPage(Webpage):
         sections = []
         for arg in topic.args():
             if arg.head() is Section:
-                sections.append(arg.args()[0]._text)
+                sections.append(arg.args()[0]._val)
         if sections:
             self.fp.write("""<p style="text-align:center;">Table of contents: """)
             for i, s in enumerate(sections):
@@ -338,20 +341,20 @@ class TopicPage(Webpage):
                 write_definitions_table(self.fp, arg.args(), center=True)
                 self.fp.write("""</div>""")
             if arg.head() is Section:
-                s = arg.args()[0]._text
+                s = arg.args()[0]._val
                 self.fp.write("""<h2 id="%s">%s</h2>""" % (escape_title(s), s))
                 sect_i += 1
             if arg.head() is Subsection:
-                s = arg.args()[0]._text
+                s = arg.args()[0]._val
                 self.fp.write("""<h3>%s</h3>""" % s)
             if arg.head() is Entries:
                 for id in arg.args():
-                    self.entry(id._text)
+                    self.entry(id._val)
             if arg.head() is SeeTopics:
                 for rel in arg.args():
-                    if rel._text not in topics_dict:
-                        print("WARNING: linked topic page '%s' missing" % rel._text)
-                rel_strs = ["""<a href="../%s/">%s</a>""" % (escape_title(rel._text), rel._text) for rel in arg.args()]
+                    if rel._val not in topics_dict:
+                        print("WARNING: linked topic page '%s' missing" % rel._val)
+                rel_strs = ["""<a href="../%s/">%s</a>""" % (escape_title(rel._val), rel._val) for rel in arg.args()]
                 self.fp.write("""<p style="text-align:center">Related topics: %s</p>""" % ", ".join(rel_strs))
             if arg.head() is Description:
                 self.fp.write(arg.html(display=True))
@@ -382,8 +385,9 @@ class SymbolPage(Webpage):
         self.pagetitle = "Symbol %s - Fungrim: The Mathematical Functions Grimoire" % self.symbol
 
     def content(self, symbol):
-        if symbol in domain_tables:
-            self.entry(domain_tables[symbol]) #, default_visible=True)
+        domain_table = domain_tables.get(symbol)
+        if domain_table is not None:
+            self.entry(domain_table) #, default_visible=True)
         else:
             write_definitions_table(self.fp, [symbol], center=True)
             self.fp.write("""<p style="margin-left:1em">The symbol <tt>%s</tt> does not yet have a definition text. """